@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_gen_amorphous.py — gen_amorphous.py 生成吞吐量基准
+=========================================================
+
+在合成的钙钛矿（SrTiO3）/ 岩盐（MgO）超胞上，按 gen_amorphous.py 的流程逐个
+生成候选结构，分阶段计时：
+
+    select    : choose_sites 选取空位
+    remove    : remove_atoms 删除原子
+    symmetry  : 空位-空位距离不变量（--spglib 时再加 spglib 指纹）
+    rattle    : rattle_atoms 随机位移
+    overlap   : overlap 检查（默认母胞骨架，--overlap full 为全量 neighbor_list）
+    write     : POSCAR 写出到临时目录
+
+每个（体系, 原子数, 浓度）组合在独立子进程中运行，报告各阶段耗时、
+structures/s 与峰值 RSS，结果写入 JSON，便于不同提交之间对比。
+全程离线，不需要任何输入文件。
+
+典型用法
+--------
+    # 默认：两种体系 × 100 / 1000 / 5000 / 20000 原子 × 浓度 0.1 0.25 0.5
+    python bench_gen_amorphous.py --output bench_new.json
+
+    # 快速对比某次修改前后
+    python bench_gen_amorphous.py --sizes 1000 5000 --nstruct 10 --output after.json \\
+        --compare before.json
+
+参数说明
+--------
+--systems        perovskite / rocksalt，默认两者都跑
+--sizes          目标原子数（按最接近的立方超胞取整），默认 100 1000 5000 20000
+--concentrations 空位浓度列表，默认 0.1 0.25 0.5
+--nstruct        每个组合生成的候选数，默认 5
+--rattle         rattle 幅度（Å），默认 0.4
+--min-sep        空位最小间距（Å），默认不设
+--min-sep-method 同 gen_amorphous.py，默认 rejection
+--symprec        对称不变量容差（Å），默认 0.01
+--spglib         symmetry 阶段同时计算 spglib 指纹（大超胞很慢）
+--overlap        skeleton（默认）| full，overlap 检查方式
+--seed           随机种子，默认 0
+--output         JSON 结果文件，默认 bench_gen_amorphous.json
+--compare        旧的 JSON 结果，打印 structures/s 的加速比
+
+依赖
+----
+    pip install ase numpy
+    pip install spglib   # 可选，--spglib 时需要
+"""
+
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from ase import Atoms
+from ase.build import bulk
+
+import gen_amorphous as ga
+from poscar_writer import write_poscar
+
+
+STAGES = ("select", "remove", "symmetry", "rattle", "overlap", "write")
+
+
+def perovskite_unit(a=3.905):
+    """立方钙钛矿 SrTiO3 原胞（5 原子）。"""
+    return Atoms("SrTiO3", cell=[a, a, a], pbc=True,
+                 scaled_positions=[[0, 0, 0], [0.5, 0.5, 0.5],
+                                   [0.5, 0.5, 0], [0.5, 0, 0.5], [0, 0.5, 0.5]])
+
+
+def rocksalt_unit(a=4.21):
+    """岩盐 MgO 立方惯用胞（8 原子）。"""
+    return bulk("MgO", "rocksalt", a=a, cubic=True)
+
+
+# 合成体系：(单胞构建函数, 空位目标元素)
+SYSTEMS = {
+    "perovskite": (perovskite_unit, "O"),
+    "rocksalt":   (rocksalt_unit, "O"),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="gen_amorphous.py 分阶段生成吞吐量基准（合成超胞，离线）。",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--systems", nargs="+", choices=sorted(SYSTEMS),
+                        default=sorted(SYSTEMS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--concentrations", type=float, nargs="+", default=[0.1, 0.25, 0.5])
+    parser.add_argument("--nstruct", type=int, default=5)
+    parser.add_argument("--rattle", type=float, default=0.4)
+    parser.add_argument("--min-sep", type=float, default=None)
+    parser.add_argument("--min-sep-method", default="rejection",
+                        choices=["rejection", "backtrack", "sequential"])
+    parser.add_argument("--max-attempts", type=int, default=5000)
+    parser.add_argument("--symprec", type=float, default=0.01)
+    parser.add_argument("--spglib", action="store_true")
+    parser.add_argument("--overlap", choices=["skeleton", "full"], default="skeleton")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_gen_amorphous.json")
+    parser.add_argument("--compare", default=None)
+    return parser.parse_args()
+
+
+def build_system(name, n_atoms):
+    """按目标原子数构建最接近的立方超胞，返回 (atoms, 目标元素)。"""
+    make_unit, target = SYSTEMS[name]
+    unit = make_unit()
+    rep = max(1, int(round((n_atoms / len(unit)) ** (1 / 3))))
+    return unit.repeat((rep, rep, rep)), target
+
+
+def peak_rss_mb():
+    """当前进程的峰值 RSS（MB）；Linux 上 ru_maxrss 单位为 KB，macOS 为字节。"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+
+def run_case(opts, system, size, conc):
+    """在子进程中跑一个组合，返回结果 dict。"""
+    atoms, target = build_system(system, size)
+    symbols = atoms.get_chemical_symbols()
+    indices_arr = np.array(ga.get_target_indices(atoms, target))
+    n_vac = ga.compute_n_vac(len(indices_arr), conc)
+    spglib = None
+    if opts["spglib"]:
+        import spglib
+
+    # 一次性准备（与 gen_amorphous.py main() 相同，所有浓度共用）
+    setup = {}
+    t0 = time.perf_counter()
+    cutoffs_by_pair, max_warn = ga.build_hard_warn_cutoffs(symbols, 0.5, 0.75)
+    cutoff_matrix = ga.build_cutoff_matrix(cutoffs_by_pair)
+    setup["cutoffs"] = time.perf_counter() - t0
+    skeleton = None
+    if opts["overlap"] == "skeleton":
+        t0 = time.perf_counter()
+        skeleton = ga.build_pair_skeleton(atoms, cutoff_matrix, max_warn, opts["rattle"])
+        setup["pair_skeleton"] = time.perf_counter() - t0
+    site_graph = None
+    if opts["min_sep"] is not None and opts["min_sep_method"] != "rejection":
+        t0 = time.perf_counter()
+        site_graph = ga.build_site_graph(atoms, indices_arr, opts["min_sep"])
+        setup["site_graph"] = time.perf_counter() - t0
+
+    times = {s: [] for s in STAGES}
+    status_count = {"ok": 0, "warn": 0, "hard": 0}
+    master_rng = np.random.default_rng(opts["seed"])
+    t_start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        for k in range(opts["nstruct"]):
+            rng = np.random.default_rng(int(master_rng.integers(0, 10**9)))
+
+            t0 = time.perf_counter()
+            chosen = ga.choose_sites(atoms, indices_arr, n_vac, opts["min_sep"], rng,
+                                     opts["max_attempts"], method=opts["min_sep_method"],
+                                     site_graph=site_graph)
+            t1 = time.perf_counter()
+            defect = ga.remove_atoms(atoms, chosen)
+            t2 = time.perf_counter()
+            ga.vacancy_invariant(atoms, chosen, opts["symprec"])
+            if spglib is not None:
+                ga.get_symmetry_fingerprint(defect, opts["symprec"], spglib)
+            t3 = time.perf_counter()
+            rattled = ga.rattle_atoms(defect, opts["rattle"], rng)
+            t4 = time.perf_counter()
+            if skeleton is not None:
+                pairs = ga.skeleton_pairs(skeleton, chosen, rattled.positions, cutoff_matrix)
+            else:
+                pairs = ga.overlap_pairs(rattled, cutoff_matrix, max_warn)
+            status, _ = ga.summarize_overlap(pairs, cutoff_matrix["symbols"])
+            t5 = time.perf_counter()
+            write_poscar(Path(tmp) / f"POSCAR_{k:03d}", rattled)
+            t6 = time.perf_counter()
+
+            for stage, dt in zip(STAGES, np.diff([t0, t1, t2, t3, t4, t5, t6])):
+                times[stage].append(float(dt))
+            status_count[status] += 1
+    wall = time.perf_counter() - t_start
+
+    return {
+        "system": system,
+        "n_atoms": len(atoms),
+        "target": target,
+        "concentration": conc,
+        "n_vac": n_vac,
+        "n_structures": opts["nstruct"],
+        "setup_s": setup,
+        "stages_s": {s: {"mean": float(np.mean(v)), "total": float(np.sum(v))}
+                     for s, v in times.items()},
+        "wall_s": wall,
+        "structures_per_s": opts["nstruct"] / wall,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "overlap_status": status_count,
+    }
+
+
+def git_revision():
+    """当前脚本所在仓库的提交号；不在 git 仓库中时返回 None。"""
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             cwd=Path(__file__).resolve().parent,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.stdout.strip() or None
+
+
+def print_case(r):
+    stages = "  ".join(f"{s}={r['stages_s'][s]['mean'] * 1e3:8.2f}" for s in STAGES)
+    print(f"{r['system']:<10} {r['n_atoms']:>6} {r['concentration']:>5.2f} "
+          f"{r['structures_per_s']:>9.2f} {r['peak_rss_mb']:>8.1f}  {stages}")
+
+
+def print_compare(results, old_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    old_cases = {(c["system"], c["n_atoms"], c["concentration"]): c for c in old["cases"]}
+    print(f"\n与 {old_path}（{old.get('meta', {}).get('git_revision')}）对比 structures/s：")
+    for r in results:
+        prev = old_cases.get((r["system"], r["n_atoms"], r["concentration"]))
+        if prev is None:
+            continue
+        ratio = r["structures_per_s"] / prev["structures_per_s"]
+        print(f"  {r['system']:<10} {r['n_atoms']:>6} {r['concentration']:>5.2f}  "
+              f"{prev['structures_per_s']:>9.2f} → {r['structures_per_s']:>9.2f}  "
+              f"(×{ratio:.2f})")
+
+
+def main():
+    args = parse_args()
+    if args.nstruct < 1:
+        sys.exit(f"[错误] --nstruct 须 >= 1，当前值：{args.nstruct}")
+    opts = {k: getattr(args, k) for k in (
+        "nstruct", "rattle", "min_sep", "min_sep_method", "max_attempts",
+        "symprec", "spglib", "overlap", "seed",
+    )}
+
+    print(f"{'system':<10} {'atoms':>6} {'conc':>5} {'struct/s':>9} {'RSS(MB)':>8}  "
+          f"各阶段平均耗时 (ms)")
+    results = []
+    for system in args.systems:
+        for size in args.sizes:
+            for conc in args.concentrations:
+                # 每个组合用新的子进程，峰值 RSS 互不影响
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    try:
+                        r = pool.submit(run_case, opts, system, size, conc).result()
+                    except (ValueError, RuntimeError) as e:
+                        print(f"[警告] {system} {size} {conc}：{e}", file=sys.stderr)
+                        continue
+                print_case(r)
+                results.append(r)
+
+    out = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "ase": __import__("ase").__version__,
+            "platform": platform.platform(),
+            "options": opts,
+        },
+        "cases": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2, ensure_ascii=False)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.compare:
+        print_compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
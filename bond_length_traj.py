@@ -4,7 +4,8 @@ bond_length_traj.py
 对多帧 XYZ 轨迹逐帧计算指定元素对的键长，再跨帧做统计聚合。
 
 支持两种统计方法（同时输出供对比）：
-  方法1: 每帧求均值 → 跨帧再平均（帧间标准差，反映帧与帧的波动）
+  方法1: 每帧求均值 → 跨帧再平均（帧间标准差，反映帧与帧的波动；
+         另按自相关与分块平均给出有效样本数和均值的标准误差，用于判断是否收敛）
   方法2: 所有键长 flatten → 直接平均（键间标准差，反映键长离散程度）
 
 用法示例：
@@ -14,6 +15,10 @@ bond_length_traj.py
   # XYZ 不含晶胞时，从 POSCAR 补充晶胞信息
   python bond_length_traj.py -i traj.xyz -e Fe O --rmax 2.2 --cell POSCAR
 
+  # 一次读取同时分析多个元素对（每帧只做一次近邻搜索），逐对指定截断
+  python bond_length_traj.py -i traj.xyz -e Bi-O Fe-O O-O --rmax Bi-O=2.6 Fe-O=2.2 O-O=3.0
+  python bond_length_traj.py -i traj.xyz -e all --scale 1.2 --cell POSCAR
+
   # 放宽截断半径（先看全分布，再定 rmax）
   python bond_length_traj.py -i traj.xyz -e Fe O --scale 1.5
 
@@ -26,6 +31,25 @@ bond_length_traj.py
   # 与 xyz_extractor.py 联用
   python xyz_extractor.py -i aimd.xyz -o sample.xyz -r 100 --start 2000
   python bond_length_traj.py -i sample.xyz -e Fe O --rmax 2.2 --cell POSCAR --plot
+
+  # 长轨迹流式读取：逐帧解析、逐帧统计，内存占用与轨迹长度无关
+  python bond_length_traj.py -i aimd.xyz -e Fe O --rmax 2.2 --cell POSCAR --stream
+
+  # NVT 轨迹：复用 Verlet 邻居表（截断 + 0.8 A 建表，位移超过 0.4 A 才重建）
+  python bond_length_traj.py -i aimd.xyz -e Fe O --rmax 2.2 --cell POSCAR --verlet-skin 0.8
+
+  # 反复调整截断时：首次运行把轨迹转存为二进制缓存 aimd.xyz.cache/，之后跳过文本解析
+  python bond_length_traj.py -i aimd.xyz -e Fe O --rmax 2.2 --cell POSCAR --cache
+
+  # 多进程：按帧字节区间分块并行（可与 --stream 联用），结果与串行一致
+  python bond_length_traj.py -i aimd.xyz -e Fe O --rmax 2.2 --cell POSCAR --stream --jobs 8
+
+方法2 的统计说明：
+  不保留全部键长，而是在线累计（Welford 均值/方差 + 从 0 开始的固定宽度直方图，
+  绘图区间宽度取 --bin-width-bond，内部再细分 50 份）。内存与总键数无关；
+  均值、标准差、范围为精确值，中位数由细分直方图插值得到
+  （误差不超过 --bin-width-bond / 100，输出中标注为"键长中位数(≈)"）。
+  --stream 只决定轨迹是逐帧读取（内存与帧数无关）还是一次性读入。
 """
 
 import argparse
@@ -39,88 +63,299 @@ from pathlib import Path
 # 键长计算核心（支持 PBC）
 # ──────────────────────────────────────────────────────────────────────────────
 
-def calc_bond_lengths_pbc(atoms, elem1, elem2, scale: float = 1.0) -> list:
-    from ase.neighborlist import NeighborList, natural_cutoffs
+# 每个原子截断半径额外加的余量（Å），对应旧版 ASE NeighborList 的默认 skin=0.3，
+# 即原子对搜索半径为 scale × (r_i + r_j) + 0.6，保持与以往结果一致
+CUTOFF_PAD = 0.3
 
-    cutoffs = natural_cutoffs(atoms, mult=scale)
-    nl = NeighborList(cutoffs, self_interaction=False, bothways=True)
-    nl.update(atoms)
 
-    symbols = atoms.get_chemical_symbols()
-    same_elem = (elem1 == elem2)
-    seen = set()
-    distances = []
+def pair_cutoffs(pairs, scale, rmaxs=None):
+    """
+    各元素对的搜索半径 {(Z1, Z2): r}：scale × (r_cov1 + r_cov2) + 2 × CUTOFF_PAD，
+    给定 rmax 时取两者较小值（超出 rmax 的键最终也会被丢弃）。
+    """
+    from ase.data import atomic_numbers, covalent_radii
 
-    for i, sym_i in enumerate(symbols):
-        if sym_i not in (elem1, elem2):
-            continue
-        indices, offsets = nl.get_neighbors(i)
-        for j, offset in zip(indices, offsets):
-            sym_j = symbols[j]
-            if same_elem:
-                if sym_i != elem1 or sym_j != elem1:
-                    continue
-            else:
-                if {sym_i, sym_j} != {elem1, elem2}:
-                    continue
-
-            if i == j:
-                neg = tuple(-o for o in offset)
-                key = (i, j, min(tuple(offset), neg))
-            elif i < j:
-                key = (i, j, tuple(offset))
-            else:
-                key = (j, i, tuple(-o for o in offset))
-
-            if key in seen:
-                continue
-            seen.add(key)
+    if rmaxs is None:
+        rmaxs = [None] * len(pairs)
+    cutoffs = {}
+    for (e1, e2), rmax in zip(pairs, rmaxs):
+        z1, z2 = atomic_numbers[e1], atomic_numbers[e2]
+        r = scale * (covalent_radii[z1] + covalent_radii[z2]) + 2 * CUTOFF_PAD
+        if rmax is not None:
+            r = min(r, rmax)
+        cutoffs[(z1, z2)] = r
+    return cutoffs
+
+
+def _pair_search(atoms, pairs, cutoffs):
+    """
+    在涉及元素的子结构上按元素对截断 cutoffs（{(Z1, Z2): r}）做一次 neighbor_list('ijdS')，
+    去重规则：i < j 保留；i == j（原子与自身周期像）只保留平移向量 S 字典序为正的一半。
+    返回 (i, j, d, S, k)：原结构中的原子索引、距离、平移向量、所属元素对在 pairs 中的序号。
+    """
+    from ase.neighborlist import neighbor_list
+
+    species = sorted({e for pair in pairs for e in pair})
+    symbols = np.asarray(atoms.get_chemical_symbols())
+    sub_mask = np.isin(symbols, species)
+    if not sub_mask.any():
+        empty = np.empty(0, dtype=int)
+        return empty, empty, np.empty(0), np.empty((0, 3), dtype=int), empty
+    sub = atoms[sub_mask]
+    codes = np.searchsorted(species, symbols[sub_mask])
+
+    i, j, d, S = neighbor_list('ijdS', sub, cutoffs, self_interaction=False)
+
+    # S 字典序为正：第一个非零分量 > 0
+    s_pos = (S[:, 0] > 0) | ((S[:, 0] == 0) & ((S[:, 1] > 0) | ((S[:, 1] == 0) & (S[:, 2] > 0))))
+    keep = (i < j) | ((i == j) & s_pos)
+    i, j, d, S = i[keep], j[keep], d[keep], S[keep]
+
+    # 元素编码对 → pairs 序号（未请求的元素对不会出现在 cutoffs 中）
+    n_sp = len(species)
+    pair_index = np.full(n_sp * n_sp, -1, dtype=int)
+    for k, (e1, e2) in enumerate(pairs):
+        k1, k2 = sorted((species.index(e1), species.index(e2)))
+        pair_index[k1 * n_sp + k2] = k
+    ci, cj = codes[i], codes[j]
+    k = pair_index[np.minimum(ci, cj) * n_sp + np.maximum(ci, cj)]
+
+    full_index = np.flatnonzero(sub_mask)
+    return full_index[i], full_index[j], d, S, k
+
+
+def calc_pair_bond_lengths_pbc(atoms, pairs, scale: float = 1.0, rmaxs=None) -> list:
+    """
+    周期性体系中多个元素对的键长（每个原子对 + 周期像只计一次），
+    返回与 pairs 对应的 NumPy 距离数组列表。
+
+    按元素对截断（pair_cutoffs）只做一次近邻搜索（_pair_search），
+    未请求的元素对不参与搜索；各元素对按序号掩码拆分。全部为数组操作。
+    """
+    _, _, d, _, k = _pair_search(atoms, pairs, pair_cutoffs(pairs, scale, rmaxs))
+    return [d[k == n] for n in range(len(pairs))]
 
-            pos_i = atoms.positions[i]
-            pos_j = atoms.positions[j] + np.array(offset) @ atoms.cell
-            distances.append(float(np.linalg.norm(pos_j - pos_i)))
 
-    return distances
+# ──────────────────────────────────────────────────────────────────────────────
+# 固定晶胞的 Verlet 邻居表复用（--verlet-skin）
+# ──────────────────────────────────────────────────────────────────────────────
+#
+# NVT 轨迹晶胞不变、帧间位移很小：以 截断 + skin 建一次候选原子对表，之后每帧
+# 只重算这些原子对的距离；自建表以来任一原子位移超过 skin/2 时才重建。
+# 位移按最小镜像计算，跨越晶胞边界被折回的原子通过整数平移展开，不会误触发重建。
+
+def new_verlet_list(pairs, scale, rmaxs, skin):
+    """Verlet 表状态；首次调用 verlet_pair_bond_lengths 时建表。"""
+    return {"pairs": pairs, "cutoffs": pair_cutoffs(pairs, scale, rmaxs),
+            "skin": skin, "ref": None, "n_builds": 0}
+
+
+def _verlet_build(vl, atoms):
+    search = {key: r + vl["skin"] for key, r in vl["cutoffs"].items()}
+    i, j, _, S, k = _pair_search(atoms, vl["pairs"], search)
+    base = np.array(list(vl["cutoffs"].values()))   # 与 pairs 一一对应（pairs 已去重）
+    vl.update(
+        i=i, j=j, k=k,
+        shift=S @ atoms.cell[:],
+        rc=base[k],
+        ref=atoms.positions.copy(),
+        image=np.zeros((len(atoms), 3)),
+        cell=atoms.cell[:].copy(),
+        inv_cell=np.linalg.inv(atoms.cell[:]),
+        numbers=atoms.numbers.copy(),
+    )
+    vl["n_builds"] += 1
+
+
+def verlet_pair_bond_lengths(vl, atoms) -> list:
+    """与 calc_pair_bond_lengths_pbc 结果相同，但复用 Verlet 候选原子对表。"""
+    if (vl["ref"] is None
+            or len(atoms) != len(vl["numbers"])
+            or not np.array_equal(atoms.numbers, vl["numbers"])
+            or not np.allclose(atoms.cell[:], vl["cell"], rtol=0, atol=1e-10)):
+        _verlet_build(vl, atoms)
+
+    # 相对建表坐标的最小镜像位移；image 为折回边界的整数平移
+    frac = (atoms.positions - vl["ref"]) @ vl["inv_cell"]
+    image = np.round(frac)
+    disp = (frac - image) @ vl["cell"]
+    if (disp ** 2).sum(axis=1).max() > (vl["skin"] / 2) ** 2:
+        _verlet_build(vl, atoms)
+        image = vl["image"]
+    pos = atoms.positions - image @ vl["cell"]
+
+    i, j = vl["i"], vl["j"]
+    d = np.linalg.norm(pos[j] - pos[i] + vl["shift"], axis=1)
+    inside = d < vl["rc"]
+    d, k = d[inside], vl["k"][inside]
+    return [d[k == n] for n in range(len(vl["pairs"]))]
+
+
+def calc_bond_lengths_pbc(atoms, elem1, elem2, scale: float = 1.0) -> np.ndarray:
+    """单个元素对的 calc_pair_bond_lengths_pbc。"""
+    return calc_pair_bond_lengths_pbc(atoms, [(elem1, elem2)], scale=scale)[0]
+
+
+# 半壳近邻格子偏移：(0, 0, 0) 加上 13 个字典序为正的偏移，每对相邻格子只访问一次
+_HALF_SHELL = np.array([(0, 0, 0)] + [
+    (dx, dy, dz)
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)
+])
+
+
+def _grid_pairs(pos, r):
+    """
+    纯 NumPy 格子分箱（cell list）：边长 r 的格子，只在本格与半壳相邻格之间配对。
+    返回所有 i < j 的候选原子对 (i, j)（距离尚未筛选）。
+    """
+    cell = np.floor((pos - pos.min(axis=0)) / r).astype(np.int64) + 1
+    dims = cell.max(axis=0) + 2            # 两侧各留一层空格子，偏移后的键不会串行
+    stride = np.array([dims[1] * dims[2], dims[2], 1])
+    key = cell @ stride
+    order = np.argsort(key, kind="stable")
+    ukey, start, count = np.unique(key[order], return_index=True, return_counts=True)
+
+    ii, jj = [], []
+    for off in _HALF_SHELL:
+        nkey = key + off @ stride
+        slot = np.minimum(np.searchsorted(ukey, nkey), len(ukey) - 1)
+        a = np.flatnonzero(ukey[slot] == nkey)
+        c, s0 = count[slot[a]], start[slot[a]]
+        i = np.repeat(a, c)
+        # 每个 i 展开其相邻格内的全部原子
+        j = order[np.repeat(s0 - np.cumsum(c) + c, c) + np.arange(c.sum())]
+        if not off.any():
+            keep = i < j
+            i, j = i[keep], j[keep]
+        ii.append(np.minimum(i, j))
+        jj.append(np.maximum(i, j))
+    return np.concatenate(ii), np.concatenate(jj)
+
+
+def radius_pairs(pos, r):
+    """
+    无 PBC 的半径查询：返回距离 < r 的全部原子对 (i, j, d)，i < j。
+    优先使用 scipy.spatial.cKDTree，未安装 scipy 时退回纯 NumPy 格子分箱，均为 O(N log N)。
+    """
+    pos = np.asarray(pos, dtype=float)
+    if len(pos) < 2 or r <= 0:
+        empty = np.empty(0, dtype=int)
+        return empty, empty, np.empty(0)
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        i, j = _grid_pairs(pos, r)
+    else:
+        ij = cKDTree(pos).query_pairs(r, output_type="ndarray")
+        i, j = ij[:, 0], ij[:, 1]
+    d = np.linalg.norm(pos[j] - pos[i], axis=1)
+    keep = d < r
+    return i[keep], j[keep], d[keep]
+
+
+def calc_bond_lengths_no_pbc(atoms, elem1, elem2, rmax: float) -> np.ndarray:
+    """单个元素对的 calc_pair_bond_lengths_no_pbc。"""
+    return calc_pair_bond_lengths_no_pbc(atoms, [(elem1, elem2)], [rmax])[0]
+
+
+def calc_pair_bond_lengths_no_pbc(atoms, pairs, radii) -> list:
+    """
+    无 PBC 时多个元素对的键长，radii 为各元素对的搜索半径。
+    在涉及元素的子结构上以最大半径做一次 radius_pairs 查询，再按元素对和各自半径拆分。
+    """
+    species = sorted({e for pair in pairs for e in pair})
+    symbols = np.asarray(atoms.get_chemical_symbols())
+    sub_mask = np.isin(symbols, species)
+    codes = np.searchsorted(species, symbols[sub_mask])
+    i, j, d = radius_pairs(atoms.positions[sub_mask], max(radii, default=0.0))
+
+    ci, cj = codes[i], codes[j]
+    lo, hi = np.minimum(ci, cj), np.maximum(ci, cj)
+    out = []
+    for (e1, e2), r in zip(pairs, radii):
+        k1, k2 = sorted((species.index(e1), species.index(e2)))
+        out.append(d[(lo == k1) & (hi == k2) & (d < r)])
+    return out
 
 
-def calc_bond_lengths_no_pbc(atoms, elem1, elem2, rmax: float) -> list:
-    symbols = np.array(atoms.get_chemical_symbols())
-    pos = atoms.positions
-    idx_a = np.where(symbols == elem1)[0]
-    idx_b = np.where(symbols == elem2)[0]
-    same_elem = (elem1 == elem2)
+# ──────────────────────────────────────────────────────────────────────────────
+# 元素对与截断解析
+# ──────────────────────────────────────────────────────────────────────────────
 
-    distances = []
-    for i in idx_a:
-        for j in idx_b:
-            if same_elem and j <= i:
-                continue
-            d = float(np.linalg.norm(pos[i] - pos[j]))
-            if d < rmax:
-                distances.append(d)
-    return distances
+def parse_pairs(tokens, species):
+    """
+    解析 -e 参数为元素对列表：
+      -e Fe O            → [(Fe, O)]
+      -e Fe O Bi O       → 两两成对
+      -e Fe-O O-O        → 以 - 连接
+      -e all             → species 中所有元素对（含同种元素）
+    Fe-O 与 O-Fe 视为同一对，只保留首次出现的写法。
+    """
+    if len(tokens) == 1 and tokens[0].lower() == "all":
+        raw = [(a, b) for k, a in enumerate(species) for b in species[k:]]
+    elif all("-" in t for t in tokens):
+        raw = [tuple(t.split("-", 1)) for t in tokens]
+    elif len(tokens) % 2 == 0 and not any("-" in t for t in tokens):
+        raw = list(zip(tokens[0::2], tokens[1::2]))
+    else:
+        sys.exit(f"错误: 无法解析 -e {' '.join(tokens)}，"
+                 f"请使用 '-e Fe O'、'-e Fe O Bi O'、'-e Fe-O O-O' 或 '-e all'。")
+    pairs, seen = [], set()
+    for pair in raw:
+        key = frozenset(pair)
+        if key not in seen:
+            seen.add(key)
+            pairs.append(pair)
+    return pairs
+
+
+def parse_rmax(tokens, pairs):
+    """
+    解析 --rmax 为 {元素对: rmax 或 None}：
+      --rmax 2.2                 → 所有元素对相同
+      --rmax 2.2 2.8             → 按 -e 顺序逐对指定
+      --rmax Fe-O=2.2 O-O=2.8    → 按名称指定，未列出的元素对不截断
+    """
+    if tokens is None:
+        return {pair: None for pair in pairs}
+    try:
+        if all("=" in t for t in tokens):
+            by_key = {}
+            for t in tokens:
+                name, value = t.split("=", 1)
+                by_key[frozenset(name.split("-", 1))] = float(value)
+            unknown = set(by_key) - {frozenset(p) for p in pairs}
+            if unknown:
+                sys.exit(f"错误: --rmax 中的元素对不在 -e 中: "
+                         f"{sorted('-'.join(sorted(k)) for k in unknown)}")
+            return {pair: by_key.get(frozenset(pair)) for pair in pairs}
+        values = [float(t) for t in tokens]
+    except ValueError:
+        sys.exit(f"错误: 无法解析 --rmax {' '.join(tokens)}")
+    if len(values) == 1:
+        return {pair: values[0] for pair in pairs}
+    if len(values) == len(pairs):
+        return dict(zip(pairs, values))
+    sys.exit(f"错误: --rmax 给出 {len(values)} 个值，但 -e 有 {len(pairs)} 个元素对。")
+
+
+def pair_label(pair):
+    return f"{pair[0]}-{pair[1]}"
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 读取帧序列
 # ──────────────────────────────────────────────────────────────────────────────
 
-def load_frames(xyz_path: Path, cell_src):
+def _resolve_cell(first, cell_src):
+    """
+    根据首帧与 --cell 决定晶胞来源，返回 (cell, use_pbc)。
+    cell 为 --cell 读取的晶胞（需逐帧覆盖），否则为 None。
+    """
     from ase.io import read
 
-    print(f"读取轨迹: {xyz_path} ... ", end="", flush=True)
-
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        frames = read(str(xyz_path), index=":", format="extxyz")
-
-    if not isinstance(frames, list):
-        frames = [frames]
-
-    print(f"{len(frames)} 帧")
-
-    cell0 = frames[0].get_cell()
-    has_cell = (cell0.volume > 1e-3)
+    has_cell = (first.get_cell().volume > 1e-3)
 
     if not has_cell and cell_src is None:
         print(
@@ -129,75 +364,474 @@ def load_frames(xyz_path: Path, cell_src):
             "       建议用 --cell POSCAR 补充晶胞以获得正确 PBC 计算。"
         )
 
+    cell = None
     if cell_src is not None:
-        ref = read(str(cell_src), format="vasp")
-        cell = ref.get_cell()
-        pbc = [True, True, True]
-        for atoms in frames:
-            atoms.set_cell(cell)
-            atoms.set_pbc(pbc)
+        cell = read(str(cell_src), format="vasp").get_cell()
         print(f"晶胞来源: {cell_src}  ({cell[0,0]:.3f} x {cell[1,1]:.3f} x {cell[2,2]:.3f} A^3)")
-    elif has_cell:
-        for atoms in frames:
-            atoms.set_pbc([True, True, True])
 
-    return frames, has_cell or (cell_src is not None)
+    return cell, has_cell or (cell_src is not None)
+
+
+def _apply_cell(atoms, cell, use_pbc):
+    if cell is not None:
+        atoms.set_cell(cell)
+    if use_pbc:
+        atoms.set_pbc([True, True, True])
+    return atoms
+
+
+def open_traj_cache(xyz_path: Path, dtype):
+    """--cache：打开或建立二进制轨迹缓存（traj_cache.py）；无法缓存时返回 None 退回文本读取。"""
+    from traj_cache import cache_dir, load_cache
+
+    try:
+        cache, built = load_cache(xyz_path, dtype)
+    except ValueError as e:
+        print(f"[警告] {e}，改为直接读取文本轨迹。")
+        return None
+    action = "已建立" if built else "使用"
+    print(f"{action}轨迹缓存: {cache_dir(xyz_path)}  "
+          f"({cache['meta']['n_frames']} 帧, {cache['meta']['dtype']})")
+    return cache
+
+
+def load_frames(xyz_path: Path, cell_src, cache=None):
+    from ase.io import read
+
+    print(f"读取轨迹: {xyz_path} ... ", end="", flush=True)
+
+    if cache is not None:
+        from traj_cache import iter_cached_atoms
+        frames = list(iter_cached_atoms(cache))
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            frames = read(str(xyz_path), index=":", format="extxyz")
+
+    if not isinstance(frames, list):
+        frames = [frames]
+
+    print(f"{len(frames)} 帧")
+
+    cell, use_pbc = _resolve_cell(frames[0], cell_src)
+    for atoms in frames:
+        _apply_cell(atoms, cell, use_pbc)
+
+    return frames, use_pbc
+
+
+def stream_frames(xyz_path: Path, cell_src, cache=None):
+    """
+    流式读取：返回 (帧迭代器, use_pbc, 首帧)。
+    帧由 ase.io.iread（或 --cache 的内存映射缓存）逐帧产出，--cell 覆盖在产出时逐帧施加，
+    任一时刻内存中只有当前帧。
+    """
+    from ase.io import iread
+
+    print(f"流式读取轨迹: {xyz_path}")
+
+    def _raw():
+        if cache is not None:
+            from traj_cache import iter_cached_atoms
+            yield from iter_cached_atoms(cache)
+            return
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            yield from iread(str(xyz_path), index=":", format="extxyz")
+
+    raw = _raw()
+    try:
+        first = next(raw)
+    except StopIteration:
+        sys.exit(f"错误: 轨迹为空: {xyz_path}")
+
+    cell, use_pbc = _resolve_cell(first, cell_src)
+
+    def _frames():
+        yield _apply_cell(first, cell, use_pbc)
+        for atoms in raw:
+            yield _apply_cell(atoms, cell, use_pbc)
+
+    return _frames(), use_pbc, first
 
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 逐帧统计
+# 在线键长统计（方法2，替代保留全部键长）
 # ──────────────────────────────────────────────────────────────────────────────
 
-def process_frames(frames, elem1, elem2, scale, rmax, use_pbc):
-    frame_means = []
-    frame_counts = []
-    all_raw = []   # 每帧筛选后的键长列表
+# 在线直方图把每个绘图区间（--bin-width-bond）再细分为 HIST_SUBBINS 个子区间，
+# 中位数在子区间内插值（分辨率 bin_width / HIST_SUBBINS），绘图时再合并回绘图区间
+HIST_SUBBINS = 50
 
-    skipped = 0
-    for fi, atoms in enumerate(frames):
-        if use_pbc:
-            dists = calc_bond_lengths_pbc(atoms, elem1, elem2, scale=scale)
-        else:
-            if rmax is None:
-                sys.exit("错误: 无晶胞时必须指定 --rmax 以限制搜索范围。")
-            dists = calc_bond_lengths_no_pbc(atoms, elem1, elem2, rmax=rmax * 1.5)
 
-        dists = [d for d in dists if d >= 0.5]
+def new_bond_stats(bin_width):
+    """
+    键长在线累计器：Welford 均值/方差 + 从 0 开始、宽度 bin_width / HIST_SUBBINS 的细分直方图。
+    内存只与键长范围有关，与总键数无关。
+    """
+    return {"n": 0, "mean": 0.0, "m2": 0.0, "min": np.inf, "max": -np.inf,
+            "bin_width": bin_width, "sub_width": bin_width / HIST_SUBBINS,
+            "hist": np.zeros(0, dtype=np.int64)}
 
-        if rmax is not None:
-            dists_shell = [d for d in dists if d < rmax]
-        else:
-            dists_shell = dists
 
-        all_raw.append(dists_shell)
+def bond_hist(stats, d):
+    """一批键长在 stats 细分区间上的计数数组（可直接传给 bond_stats_add_hist）。"""
+    return np.bincount((d // stats["sub_width"]).astype(np.int64))
 
-        if not dists_shell:
-            skipped += 1
-            continue
 
-        frame_means.append(float(np.mean(dists_shell)))
-        frame_counts.append(len(dists_shell))
+def bond_moments(d):
+    """一批（非空）键长的 (个数, 均值, 离差平方和, 最小值, 最大值)。"""
+    mean = float(d.mean())
+    return (d.size, mean, float(((d - mean) ** 2).sum()), float(d.min()), float(d.max()))
+
+
+def bond_stats_merge(stats, moments):
+    """把 bond_moments 并入累计器（Chan 等的分组 Welford 合并，数值稳定）。"""
+    n_b, mean_b, m2_b, min_b, max_b = moments
+    n = stats["n"] + n_b
+    delta = mean_b - stats["mean"]
+    stats["mean"] += delta * n_b / n
+    stats["m2"] += m2_b + delta * delta * stats["n"] * n_b / n
+    stats["n"] = n
+    stats["min"] = min(stats["min"], min_b)
+    stats["max"] = max(stats["max"], max_b)
+
+
+def bond_stats_add_hist(stats, counts):
+    """把同样分箱（从 0 开始、宽度 sub_width）的计数数组加到直方图上。"""
+    hist = stats["hist"]
+    if len(counts) > len(hist):
+        hist = np.concatenate([hist, np.zeros(len(counts) - len(hist), dtype=np.int64)])
+    hist[:len(counts)] += counts
+    stats["hist"] = hist
+
+
+def bond_stats_add(stats, dists):
+    """把一帧（一批）键长并入累计器。"""
+    d = np.asarray(dists, dtype=float)
+    if d.size == 0:
+        return
+    bond_stats_merge(stats, bond_moments(d))
+    bond_stats_add_hist(stats, bond_hist(stats, d))
+
+
+def bond_stats_quantile(stats, q):
+    """由直方图线性插值估计分位数（区间内均匀分布假设），并截断到 [min, max]。"""
+    cum = np.cumsum(stats["hist"])
+    target = q * stats["n"]
+    k = int(np.searchsorted(cum, target))
+    below = cum[k - 1] if k > 0 else 0
+    frac = (target - below) / stats["hist"][k]
+    value = (k + frac) * stats["sub_width"]
+    return float(min(max(value, stats["min"]), stats["max"]))
+
+
+def bond_stats_histogram(stats):
+    """按 bin_width 合并后的直方图 (edges, counts)，只保留首个非空区间之后的部分。"""
+    fine = stats["hist"]
+    pad = -len(fine) % HIST_SUBBINS
+    counts = np.concatenate([fine, np.zeros(pad, dtype=np.int64)])
+    counts = counts.reshape(-1, HIST_SUBBINS).sum(axis=1)
+    k0 = int(np.flatnonzero(counts)[0])
+    edges = np.arange(k0, len(counts) + 1) * stats["bin_width"]
+    return edges, counts[k0:]
+
+
+def bond_stats_summary(stats):
+    """方法2 的统计结果：个数、均值、标准差、范围与（直方图插值的）中位数。"""
+    n = stats["n"]
+    return {
+        "n": n,
+        "mean": stats["mean"],
+        "std": float(np.sqrt(stats["m2"] / (n - 1))) if n > 1 else 0.0,
+        "min": stats["min"],
+        "max": stats["max"],
+        "median": bond_stats_quantile(stats, 0.5),
+    }
+
 
-    if skipped:
-        print(f"[警告] {skipped} 帧未找到 {elem1}-{elem2} 键（可能需要调整 --scale 或 --rmax）。")
+# ──────────────────────────────────────────────────────────────────────────────
+# 帧均值序列的相关性：分块平均与自相关（方法1 的真实标准误差）
+# ──────────────────────────────────────────────────────────────────────────────
+#
+# AIMD 相邻帧高度相关，std / sqrt(帧数) 会严重低估帧均值的误差。
+# 两种互相印证的估计：
+#   分块平均（Flyvbjerg–Petersen）：反复把相邻两个数据平均，块足够长后块均值近似独立，
+#       标准误差随块长增大而进入平台；按 Lee 等 (2011) 的判据 B^3 > 2 n (σ_B / σ_0)^4
+#       取最小的满足条件的块长 B。
+#   自相关：FFT 计算归一化自相关函数 ρ(t)（O(n log n)），积分相关时间
+#       τ = 1 + 2 Σ ρ(t)，求和窗口按 Sokal 自洽判据取最小的 M ≥ 5 τ(M)；
+#       有效样本数 n_eff = n / τ，标准误差 = std / sqrt(n_eff)。
+
+MIN_CORR_FRAMES = 16   # 少于此帧数时不做相关性分析
+
+
+def block_average(x):
+    """
+    Flyvbjerg–Petersen 分块平均。返回 {"levels": [(块长, 块数, 标准误差, 误差的误差), ...],
+    "block": 选定块长, "n_blocks": 块数, "sem": 标准误差}；平台未出现时 block 为 None，
+    sem 取最大一级的估计（下限）。
+    """
+    x = np.asarray(x, dtype=float)
+    n0 = len(x)
+    levels = []
+    size = 1
+    while len(x) >= 2:
+        n = len(x)
+        sem = float(np.sqrt(x.var() / (n - 1)))
+        levels.append((size, n, sem, sem / np.sqrt(2.0 * (n - 1))))
+        if n % 2:
+            x = x[:-1]
+        x = 0.5 * (x[0::2] + x[1::2])
+        size *= 2
+
+    sem0 = levels[0][2]
+    for size, n, sem, _ in levels:
+        if sem0 == 0.0 or size ** 3 > 2 * n0 * (sem / sem0) ** 4:
+            return {"levels": levels, "block": size, "n_blocks": n, "sem": sem}
+    return {"levels": levels, "block": None, "n_blocks": levels[-1][1],
+            "sem": max(level[2] for level in levels)}
+
+
+def autocorrelation(x):
+    """FFT 计算的归一化自相关函数 ρ(t)，t = 0 .. n-1（补零到 2n，避免循环相关）。"""
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    d = x - x.mean()
+    nfft = 1 << (2 * n - 1).bit_length()
+    f = np.fft.rfft(d, nfft)
+    acf = np.fft.irfft(f * np.conj(f), nfft)[:n]
+    if acf[0] == 0.0:
+        return np.r_[1.0, np.zeros(n - 1)]
+    return acf / acf[0]
+
+
+def integrated_autocorr_time(x, c=5.0):
+    """积分相关时间 τ（单位：帧），Sokal 自洽窗口；返回 (τ, 窗口 M)。"""
+    rho = autocorrelation(x)
+    taus = 2.0 * np.cumsum(rho) - 1.0          # τ(M) = 1 + 2 Σ_{t=1..M} ρ(t)
+    window = np.arange(len(taus)) >= c * taus
+    m = int(np.argmax(window)) if window.any() else len(taus) - 1
+    return max(float(taus[m]), 1.0), m
+
+
+def correlation_summary(frame_means):
+    """帧均值序列的有效样本数与标准误差；帧数不足时返回 None。"""
+    x = np.asarray(frame_means, dtype=float)
+    n = len(x)
+    if n < MIN_CORR_FRAMES:
+        return None
+    tau, window = integrated_autocorr_time(x)
+    n_eff = n / tau
+    blocks = block_average(x)
+    return {
+        "n": n,
+        "tau": tau,
+        "window": window,
+        "n_eff": n_eff,
+        "sem_acf": float(x.std(ddof=1) / np.sqrt(n_eff)),
+        "sem_naive": float(x.std(ddof=1) / np.sqrt(n)),
+        "block": blocks["block"],
+        "n_blocks": blocks["n_blocks"],
+        "sem_block": blocks["sem"],
+    }
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 逐帧统计
+# ──────────────────────────────────────────────────────────────────────────────
 
-    return frame_means, frame_counts, all_raw
+def new_pair_acc(pair, rmax, bin_width):
+    """
+    单个元素对的逐帧累计器：逐帧均值/键数，以及全部键长的在线累计器 stats
+    （直方图区间宽度 bin_width），不保留逐个键长。
+    """
+    return {
+        "pair": pair,
+        "rmax": rmax,
+        "means": [],
+        "counts": [],
+        "stats": new_bond_stats(bin_width),
+        "skipped": 0,
+    }
+
+
+def pair_acc_add_frame(acc, dists):
+    """把一帧的候选键长（截断前）筛选后并入累计器。"""
+    dists = dists[dists >= 0.5]
+
+    if acc["rmax"] is not None:
+        dists_shell = dists[dists < acc["rmax"]]
+    else:
+        dists_shell = dists
+
+    if dists_shell.size == 0:
+        acc["skipped"] += 1
+        return
+
+    if "moments" in acc:
+        # --jobs 工作进程：逐帧矩留给主进程按帧顺序合并，这里只累计直方图
+        acc["moments"].append(bond_moments(dists_shell))
+        bond_stats_add_hist(acc["stats"], bond_hist(acc["stats"], dists_shell))
+    else:
+        bond_stats_add(acc["stats"], dists_shell)
+    acc["means"].append(float(np.mean(dists_shell)))
+    acc["counts"].append(int(dists_shell.size))
+
+
+def analyse_frames(frames, accs, scale, use_pbc, skin=None):
+    """
+    process_frames 的计算部分（不打印）：每帧一次近邻搜索，同时喂给所有元素对的累计器。
+    skin 非 None 且为 PBC 体系时使用 Verlet 表，返回建表次数（否则返回 None）。
+    """
+    pairs = [acc["pair"] for acc in accs]
+    rmaxs = [acc["rmax"] for acc in accs]
+    vl = new_verlet_list(pairs, scale, rmaxs, skin) if (use_pbc and skin) else None
+    if not use_pbc:
+        if any(acc["rmax"] is None for acc in accs):
+            sys.exit("错误: 无晶胞时必须指定 --rmax 以限制搜索范围。")
+        radii = [acc["rmax"] * 1.5 for acc in accs]
+
+    for atoms in frames:
+        if vl is not None:
+            per_pair = verlet_pair_bond_lengths(vl, atoms)
+        elif use_pbc:
+            per_pair = calc_pair_bond_lengths_pbc(atoms, pairs, scale=scale, rmaxs=rmaxs)
+        else:
+            per_pair = calc_pair_bond_lengths_no_pbc(atoms, pairs, radii)
+        for acc, dists in zip(accs, per_pair):
+            pair_acc_add_frame(acc, dists)
+
+    return None if vl is None else vl["n_builds"]
+
+
+def _report_frames(accs, n_builds=None, show_count=False):
+    acc0 = accs[0]
+    n_frames = len(acc0["means"]) + acc0["skipped"]
+    if show_count:
+        print(f"共处理 {n_frames} 帧")
+    if n_builds is not None:
+        print(f"Verlet 邻居表: {n_frames} 帧中重建 {n_builds} 次")
+    for acc in accs:
+        if acc["skipped"]:
+            elem1, elem2 = acc["pair"]
+            print(f"[警告] {acc['skipped']} 帧未找到 {elem1}-{elem2} 键"
+                  f"（可能需要调整 --scale 或 --rmax）。")
+
+
+def process_frames(frames, accs, scale, use_pbc, skin=None):
+    """
+    逐帧计算键长并累计到 accs（new_pair_acc 列表）。
+    frames 可以是列表，也可以是 stream_frames 的迭代器。
+    """
+    n_builds = analyse_frames(frames, accs, scale, use_pbc, skin=skin)
+    # 流式读取时帧数事先未知，在此补报
+    _report_frames(accs, n_builds, show_count=not isinstance(frames, list))
+    return accs
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 多进程逐块统计（--jobs）
+# ──────────────────────────────────────────────────────────────────────────────
+#
+# 与 xyz_extractor.py 相同，先扫描一遍文件得到每帧的字节偏移（不解析坐标），
+# 再把连续的帧按字节区间切块分给工作进程。每个进程只解析、分析自己的块，
+# 返回逐帧均值/键数、逐帧矩与块直方图。主进程按块顺序归并，逐帧矩按帧顺序
+# 合并，结果与串行运行一致。
+
+MAX_CHUNK_FRAMES = 1000   # 每块最多帧数，限制单个进程的内存占用
+
+
+def _analyse_chunk(xyz_path, start, stop, cell, use_pbc, pairs, rmaxs, scale, bin_width,
+                   skin=None, cached=False):
+    """
+    工作进程：解析字节区间 [start, stop) 内的帧并统计（cached 时为缓存中的帧序号区间）。
+    每个元素对返回逐帧均值/键数、逐帧矩与块直方图，不返回逐个键长。
+    """
+    import io
+    from ase.io import read
+
+    if cached:
+        from traj_cache import iter_cached_atoms, open_cache
+        frames = list(iter_cached_atoms(open_cache(xyz_path), start, stop))
+    else:
+        with open(xyz_path, "rb") as fh:
+            fh.seek(start)
+            text = fh.read(stop - start).decode()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            frames = read(io.StringIO(text), index=":", format="extxyz")
+    for atoms in frames:
+        _apply_cell(atoms, cell, use_pbc)
+
+    # 逐帧矩需在主进程按帧顺序合并，因此这里只记录、不合并
+    parts = [{"pair": pair, "rmax": rmax, "means": [], "counts": [], "skipped": 0,
+              "moments": [], "stats": new_bond_stats(bin_width)}
+             for pair, rmax in zip(pairs, rmaxs)]
+    n_builds = analyse_frames(frames, parts, scale, use_pbc, skin=skin)
+    for part in parts:
+        part["hist"] = part.pop("stats")["hist"]
+    return parts, n_builds
+
+
+def process_frames_parallel(xyz_path, offsets, cell, accs, scale, use_pbc, jobs, skin=None,
+                            cached=False):
+    """
+    --jobs 模式的 process_frames：按字节区间分块并行，累计结果与串行相同。
+    cached 时各进程按帧序号区间直接读取内存映射缓存。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    n_frames = len(offsets)
+    chunk = max(1, min(MAX_CHUNK_FRAMES, -(-n_frames // (jobs * 8))))
+    if cached:
+        bounds = list(range(0, n_frames, chunk)) + [n_frames]
+    else:
+        bounds = offsets[::chunk] + [xyz_path.stat().st_size]
+    bin_width = accs[0]["stats"]["bin_width"]
+    pairs = [acc["pair"] for acc in accs]
+    rmaxs = [acc["rmax"] for acc in accs]
+    if not use_pbc and any(r is None for r in rmaxs):
+        sys.exit("错误: 无晶胞时必须指定 --rmax 以限制搜索范围。")
+    print(f"并行计算: {jobs} 进程，{len(bounds) - 1} 块（每块 ≤ {chunk} 帧）")
+
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        futures = [
+            ex.submit(_analyse_chunk, str(xyz_path), start, stop, cell, use_pbc,
+                      pairs, rmaxs, scale, bin_width, skin, cached)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        n_builds = None
+        for fut in futures:          # 按块顺序归并
+            parts, chunk_builds = fut.result()
+            if chunk_builds is not None:
+                n_builds = (n_builds or 0) + chunk_builds
+            for acc, part in zip(accs, parts):
+                acc["means"].extend(part["means"])
+                acc["counts"].extend(part["counts"])
+                acc["skipped"] += part["skipped"]
+                for mom in part["moments"]:
+                    bond_stats_merge(acc["stats"], mom)
+                bond_stats_add_hist(acc["stats"], part["hist"])
+
+    _report_frames(accs, n_builds)
+    return accs
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 输出统计摘要（同时展示两种方法）
 # ──────────────────────────────────────────────────────────────────────────────
 
-def print_summary(frame_means, frame_counts, all_raw, elem1, elem2, rmax):
+def print_summary(frame_means, frame_counts, bond_stats, elem1, elem2, rmax):
     # 方法1：帧均值再平均
     m1_mean = float(np.mean(frame_means))
     m1_std  = float(np.std(frame_means, ddof=1)) if len(frame_means) > 1 else 0.0
     mean_count = float(np.mean(frame_counts))
 
-    # 方法2：所有键长 flatten 后统计
-    flat = [d for frame in all_raw for d in frame]
-    m2_mean = float(np.mean(flat))
-    m2_std  = float(np.std(flat, ddof=1)) if len(flat) > 1 else 0.0
+    # 方法2：所有键长 flatten 后统计（取在线累计结果，不保留逐个键长）
+    bonds = bond_stats_summary(bond_stats)
+    m2_mean = bonds["mean"]
+    m2_std  = bonds["std"]
 
     shell_str = f" < {rmax} A" if rmax else ""
     w = 54
@@ -206,7 +840,7 @@ def print_summary(frame_means, frame_counts, all_raw, elem1, elem2, rmax):
     print(f"  {elem1}-{elem2} 键长统计  ({len(frame_means)} 帧){shell_str}")
     print(f"{'='*w}")
     print(f"  有效帧数         : {len(frame_means)}")
-    print(f"  总键数           : {len(flat)}")
+    print(f"  总键数           : {bonds['n']}")
     print(f"  平均键数/帧      : {mean_count:.1f}")
 
     print(f"\n  [方法1]  逐帧均值 -> 跨帧再平均")
@@ -214,31 +848,68 @@ def print_summary(frame_means, frame_counts, all_raw, elem1, elem2, rmax):
     print(f"    标准差(帧间)   : {m1_std:.4f} A   <- 帧与帧之间的波动")
     print(f"    帧均值范围     : [{np.min(frame_means):.4f}, {np.max(frame_means):.4f}] A")
     print(f"    帧均值中位数   : {np.median(frame_means):.4f} A")
+    corr = correlation_summary(frame_means)
+    if corr is None:
+        print(f"    相关性分析     : 帧数 < {MIN_CORR_FRAMES}，跳过")
+    else:
+        print(f"    积分相关时间   : {corr['tau']:.1f} 帧   (窗口 {corr['window']} 帧)")
+        print(f"    有效样本数     : {corr['n_eff']:.1f} / {corr['n']}")
+        print(f"    标准误差(ACF)  : {corr['sem_acf']:.5f} A   "
+              f"<- 按独立帧计算为 {corr['sem_naive']:.5f} A")
+        if corr["block"] is not None:
+            print(f"    标准误差(分块) : {corr['sem_block']:.5f} A   "
+                  f"(块长 {corr['block']} 帧，{corr['n_blocks']} 块)")
+        else:
+            print(f"    标准误差(分块) : >= {corr['sem_block']:.5f} A   "
+                  f"(未达平台，轨迹可能过短)")
 
     print(f"\n  [方法2]  所有键长 flatten -> 直接平均")
     print(f"    均值           : {m2_mean:.4f} A")
     print(f"    标准差(键间)   : {m2_std:.4f} A   <- 所有键的离散程度")
-    print(f"    键长范围       : [{np.min(flat):.4f}, {np.max(flat):.4f}] A")
-    print(f"    键长中位数     : {np.median(flat):.4f} A")
+    print(f"    键长范围       : [{bonds['min']:.4f}, {bonds['max']:.4f}] A")
+    print(f"    键长中位数(≈)  : {bonds['median']:.4f} A")
 
     diff = abs(m1_mean - m2_mean)
     note = "一致" if diff < 0.0005 else "有差异（每帧键数不均匀）"
     print(f"\n  两种方法均值差   : {diff:.4f} A  ({note})")
     print(f"{'='*w}")
 
-    return m1_mean, m1_std, m2_mean, m2_std, flat
+    return m1_mean, m1_std, m2_mean, m2_std
+
+
+def print_pair_table(results):
+    """多元素对时的汇总表。results 为 (acc, m1_mean, m1_std, m2_mean, m2_std) 列表。"""
+    w = 88
+    print(f"\n{'='*w}")
+    print(f"  {'pair':<10}{'rmax(A)':>8}{'frames':>8}{'bonds/fr':>10}"
+          f"{'M1 mean':>10}{'M1 std':>10}{'M1 SE':>10}{'M2 mean':>10}{'M2 std':>10}")
+    print(f"{'-'*w}")
+    for acc, m1_mean, m1_std, m2_mean, m2_std in results:
+        rmax = f"{acc['rmax']:.3f}" if acc["rmax"] else "-"
+        corr = correlation_summary(acc["means"])
+        sem = f"{corr['sem_acf']:.5f}" if corr else "-"
+        print(f"  {pair_label(acc['pair']):<10}{rmax:>8}{len(acc['means']):>8}"
+              f"{np.mean(acc['counts']):>10.1f}{m1_mean:>10.4f}{m1_std:>10.4f}"
+              f"{sem:>10}{m2_mean:>10.4f}{m2_std:>10.4f}")
+    print(f"{'='*w}")
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 绘图（3 子图：逐帧曲线、帧均值分布、全部键长分布）
 # ──────────────────────────────────────────────────────────────────────────────
 
-def plot_results(frame_means, flat, elem1, elem2, rmax,
-                 bin_width_frame=0.02, bin_width_bond=0.05, output_file=None):
+def plot_results(frame_means, bond_stats, elem1, elem2, rmax,
+                 bin_width_frame=0.02, output_file=None):
+    # 仅在 --plot 时导入 matplotlib；强制 Agg 后端，登录节点无显示也能直接出图
     try:
         import matplotlib
+        matplotlib.use("Agg")
         import matplotlib.pyplot as plt
-        matplotlib.rcParams['font.family'] = 'Times New Roman'
+        from matplotlib import font_manager
+        # 未安装 Times New Roman 时退回 serif，避免逐个文本查找字体并告警
+        fonts = {f.name for f in font_manager.fontManager.ttflist}
+        matplotlib.rcParams['font.family'] = ('Times New Roman' if 'Times New Roman' in fonts
+                                              else 'serif')
         matplotlib.rcParams['font.size'] = 11
     except ImportError:
         print("[警告] 未找到 matplotlib，跳过绘图。")
@@ -246,8 +917,8 @@ def plot_results(frame_means, flat, elem1, elem2, rmax,
 
     m1_mean = np.mean(frame_means)
     m1_std  = np.std(frame_means, ddof=1) if len(frame_means) > 1 else 0.0
-    m2_mean = np.mean(flat)
-    m2_std  = np.std(flat, ddof=1) if len(flat) > 1 else 0.0
+    bonds = bond_stats_summary(bond_stats)
+    m2_mean, m2_std = bonds["mean"], bonds["std"]
 
     fig, axes = plt.subplots(1, 3, figsize=(16, 4.5))
 
@@ -273,7 +944,7 @@ def plot_results(frame_means, flat, elem1, elem2, rmax,
     lo = np.floor(min(frame_means) / bin_width_frame) * bin_width_frame
     hi = np.ceil( max(frame_means) / bin_width_frame) * bin_width_frame
     bins = np.arange(lo, hi + bin_width_frame, bin_width_frame)
-    ax.hist(frame_means, bins=bins, color="steelblue", edgecolor="black", linewidth=0.6)
+    _stairs(ax, *np.histogram(frame_means, bins=bins), color="steelblue")
     ax.axvline(m1_mean, color="crimson", linestyle="--", linewidth=1.2,
                label=f"Mean = {m1_mean:.4f} A")
     ax.axvline(m1_mean + m1_std, color="darkorange", linestyle=":", linewidth=1.0,
@@ -288,10 +959,9 @@ def plot_results(frame_means, flat, elem1, elem2, rmax,
 
     # ── 图3：全部键长分布直方图（方法2）──
     ax = axes[2]
-    lo = np.floor(min(flat) / bin_width_bond) * bin_width_bond
-    hi = np.ceil( max(flat) / bin_width_bond) * bin_width_bond
-    bins = np.arange(lo, hi + bin_width_bond, bin_width_bond)
-    ax.hist(flat, bins=bins, color="mediumseagreen", edgecolor="black", linewidth=0.6)
+    # 直接画在线累计的直方图（按 --bin-width-bond 合并），不再逐个键长重新分箱
+    edges, counts = bond_stats_histogram(bond_stats)
+    _stairs(ax, counts, edges, color="mediumseagreen")
     ax.axvline(m2_mean, color="crimson", linestyle="--", linewidth=1.2,
                label=f"Mean = {m2_mean:.4f} A")
     ax.axvline(m2_mean + m2_std, color="darkorange", linestyle=":", linewidth=1.0,
@@ -311,6 +981,20 @@ def plot_results(frame_means, flat, elem1, elem2, rmax,
     plt.close(fig)
 
 
+def pair_plot_path(output_file, pair, multi):
+    """多元素对时在图像文件名后加元素对后缀，如 bond_length_traj_Fe-O.png。"""
+    out = Path(output_file if output_file else "bond_length_traj.png")
+    if not multi:
+        return str(out)
+    return str(out.with_name(f"{out.stem}_{pair_label(pair)}{out.suffix}"))
+
+
+def _stairs(ax, counts, edges, color):
+    """预先分箱的直方图：填充阶梯 + 黑色轮廓（与 ax.hist 的柱状外观相近）。"""
+    ax.stairs(counts, edges, fill=True, color=color)
+    ax.stairs(counts, edges, color="black", linewidth=0.6)
+
+
 def _style_ax(ax):
     for spine in ax.spines.values():
         spine.set_linewidth(0.8)
@@ -330,20 +1014,33 @@ def build_parser():
     )
     p.add_argument("-i", "--input",    required=True,
                    help="多帧 XYZ 轨迹文件")
-    p.add_argument("-e", "--elements", nargs=2, metavar=("ELEM1", "ELEM2"), required=True,
-                   help="要分析的元素对，例如 -e Fe O")
+    p.add_argument("-e", "--elements", nargs="+", metavar="ELEM", required=True,
+                   help="要分析的元素对，例如 -e Fe O；多对：-e Fe O Bi O 或 -e Fe-O O-O；"
+                        "全部元素对：-e all")
     p.add_argument("--cell",           default=None,
                    help="当 XYZ 不含晶胞时，从此 POSCAR/CONTCAR 读取晶胞（推荐）")
     p.add_argument("--scale",          type=float, default=1.0,
                    help="natural_cutoffs 缩放因子（默认 1.0；建议先用 1.5 看全分布）")
-    p.add_argument("--rmax",           type=float, default=None,
-                   help="只统计 < rmax (A) 的键（第一配位壳截断）")
+    p.add_argument("--rmax",           nargs="+", default=None, metavar="RMAX",
+                   help="只统计 < rmax (A) 的键（第一配位壳截断）；多对时可逐对给出 "
+                        "（--rmax 2.2 2.8）或按名称给出（--rmax Fe-O=2.2 O-O=2.8）")
     p.add_argument("--no-pbc",         action="store_true",
                    help="强制不使用 PBC（分子体系，必须配合 --rmax）")
     p.add_argument("--bin-width-frame", type=float, default=0.02,
                    help="图2（帧均值分布）直方图区间宽度，单位 A（默认 0.02）")
     p.add_argument("--bin-width-bond",  type=float, default=0.05,
                    help="图3（全部键长分布）直方图区间宽度，单位 A（默认 0.05）")
+    p.add_argument("--stream",         action="store_true",
+                   help="流式逐帧读取，内存与轨迹长度无关（适合超长 AIMD 轨迹）")
+    p.add_argument("--verlet-skin",    type=float, default=None, metavar="SKIN",
+                   help="固定晶胞轨迹（NVT）复用 Verlet 邻居表：以 截断+SKIN (A) 建表，"
+                        "原子位移超过 SKIN/2 时才重建（建议 0.5–1.0；仅 PBC 体系，非周期时忽略并警告）")
+    p.add_argument("--cache",          nargs="?", const="float64", default=None,
+                   choices=["float64", "float32"],
+                   help="使用二进制轨迹缓存 <输入>.cache/（按路径、大小、mtime 判断是否过期），"
+                        "首次运行建立，之后跳过文本解析；可选坐标精度（默认 float64）")
+    p.add_argument("--jobs",           type=int, default=1,
+                   help="并行进程数（默认 1）；按帧字节区间分块，结果与串行一致")
     p.add_argument("--plot",           action="store_true",
                    help="输出 3 张图（逐帧曲线、帧均值分布、全部键长分布）")
     p.add_argument("--plot-output",    default=None, metavar="FILE",
@@ -363,53 +1060,119 @@ def main():
     if cell_src and not cell_src.exists():
         sys.exit(f"错误: 找不到晶胞文件: {cell_src}")
 
-    frames, use_pbc = load_frames(src, cell_src)
+    if args.jobs < 1:
+        sys.exit(f"错误: --jobs 须 >= 1，当前值：{args.jobs}")
+    if args.verlet_skin is not None and args.verlet_skin <= 0:
+        sys.exit(f"错误: --verlet-skin 须 > 0，当前值：{args.verlet_skin}")
+
+    cache = open_traj_cache(src, args.cache) if args.cache else None
+    if args.jobs > 1 and cache is None:
+        from xyz_extractor import build_frame_index
+
+        print(f"索引轨迹: {src} ... ", end="", flush=True)
+        try:
+            offsets, _ = build_frame_index(src)
+        except ValueError as e:
+            print(f"\n[警告] 无法按字节索引轨迹（{e}），改为串行计算。")
+            args.jobs = 1
+        else:
+            print(f"{len(offsets)} 帧")
+    if args.jobs > 1:
+        from ase.io import read
+
+        if cache is not None:
+            from traj_cache import cached_atoms
+            offsets = cache["offsets"].tolist()
+            first = cached_atoms(cache, 0)
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                first = read(str(src), index=0, format="extxyz")
+        cell, use_pbc = _resolve_cell(first, cell_src)
+        frames = None
+        head = [first]
+    elif args.stream:
+        frames, use_pbc, first = stream_frames(src, cell_src, cache)
+        head = [first]
+    else:
+        frames, use_pbc = load_frames(src, cell_src, cache)
+        head = frames[:5]
 
     if args.no_pbc:
         use_pbc = False
 
     all_syms = set()
-    for atoms in frames[:5]:
-        all_syms.update(atoms.get_chemical_symbols())
-    elem1, elem2 = args.elements
-    for e in (elem1, elem2):
+    species = []
+    for atoms in head:
+        for sym in atoms.get_chemical_symbols():
+            if sym not in all_syms:
+                all_syms.add(sym)
+                species.append(sym)
+    pairs = parse_pairs(args.elements, species)
+    for e in {e for pair in pairs for e in pair}:
         if e not in all_syms:
             sys.exit(f"错误: 元素 {e} 在轨迹前几帧中未找到，可用元素: {sorted(all_syms)}")
+    rmax_of = parse_rmax(args.rmax, pairs)
+    accs = [new_pair_acc(pair, rmax_of[pair], args.bin_width_bond) for pair in pairs]
 
-    print(f"\n分析键对  : {elem1}-{elem2}")
+    print(f"\n分析键对  : {', '.join(pair_label(p) for p in pairs)}")
     print(f"截断缩放  : x{args.scale}")
     print(f"PBC 模式  : {'是' if use_pbc else '否（无周期性边界）'}")
-    if args.rmax:
-        print(f"第一壳截断: rmax = {args.rmax} A")
+    if len(pairs) == 1:
+        rmax = rmax_of[pairs[0]]
+        if rmax:
+            print(f"第一壳截断: rmax = {rmax} A")
+        else:
+            print("第一壳截断: 未设置（统计所有键，建议指定 --rmax）")
     else:
-        print("第一壳截断: 未设置（统计所有键，建议指定 --rmax）")
+        print("第一壳截断: " + ", ".join(
+            f"{pair_label(p)} < {rmax_of[p]} A" if rmax_of[p] else f"{pair_label(p)} 未设置"
+            for p in pairs
+        ))
+
+    skin = args.verlet_skin
+    if skin is not None and not use_pbc:
+        print("[警告] --verlet-skin 只用于周期性（PBC）轨迹，非周期体系每帧直接搜索，已忽略。")
+        skin = None
 
     print("\n逐帧计算中 ...")
 
-    frame_means, frame_counts, all_raw = process_frames(
-        frames, elem1, elem2,
-        scale=args.scale,
-        rmax=args.rmax,
-        use_pbc=use_pbc,
-    )
+    if frames is None:
+        process_frames_parallel(src, offsets, cell, accs,
+                                scale=args.scale, use_pbc=use_pbc, jobs=args.jobs,
+                                skin=skin, cached=cache is not None)
+    else:
+        process_frames(frames, accs, scale=args.scale, use_pbc=use_pbc,
+                       skin=skin)
 
-    if not frame_means:
-        sys.exit(f"\n错误: 所有帧均未找到 {elem1}-{elem2} 键。\n"
+    found = [acc for acc in accs if acc["means"]]
+    if not found:
+        names = ", ".join(pair_label(p) for p in pairs)
+        sys.exit(f"\n错误: 所有帧均未找到 {names} 键。\n"
                  f"请尝试: 增大 --scale（如 1.5），或检查元素名称。")
 
-    m1_mean, m1_std, m2_mean, m2_std, flat = print_summary(
-        frame_means, frame_counts, all_raw, elem1, elem2, args.rmax
-    )
-
-    if args.plot:
-        plot_results(
-            frame_means, flat,
-            elem1, elem2,
-            rmax=args.rmax,
-            bin_width_frame=args.bin_width_frame,
-            bin_width_bond=args.bin_width_bond,
-            output_file=args.plot_output,
+    results = []
+    for acc in accs:
+        elem1, elem2 = acc["pair"]
+        if not acc["means"]:
+            print(f"\n[警告] 所有帧均未找到 {elem1}-{elem2} 键，跳过该元素对。")
+            continue
+        m1_mean, m1_std, m2_mean, m2_std = print_summary(
+            acc["means"], acc["counts"], acc["stats"], elem1, elem2, acc["rmax"],
         )
+        results.append((acc, m1_mean, m1_std, m2_mean, m2_std))
+
+        if args.plot:
+            plot_results(
+                acc["means"], acc["stats"],
+                elem1, elem2,
+                rmax=acc["rmax"],
+                bin_width_frame=args.bin_width_frame,
+                output_file=pair_plot_path(args.plot_output, acc["pair"], len(pairs) > 1),
+            )
+
+    if len(pairs) > 1:
+        print_pair_table(results)
 
 
 if __name__ == "__main__":
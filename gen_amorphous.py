@@ -74,16 +74,51 @@ gen_amorphous.py — 非晶初始结构生成器
                           0.30–0.50 Å：非晶初始结构（推荐）
                           > 0.5  Å：可能产生大量 overlap，不建议
 --min-sep               空位间最小距离（Å），高浓度时建议不设
+--min-sep-method        min-sep 采样方式，默认 rejection（与旧版行为及种子结果一致）
+                          rejection  : 整体随机抽取再检查，在满足约束的组合中严格
+                                       均匀，但高浓度几乎无法成功
+                          backtrack  : 最小度优先的深度优先搜索，死路时回溯，
+                                       高浓度下毫秒级完成，可越过 RSA 堵塞覆盖率，
+                                       适合接近最密排布的情形（此时空位分布趋于有序）；
+                                       分布不再严格均匀
+                          sequential : 在子晶格冲突图上随机顺序逐个选位（RSA），
+                                       卡住则换顺序重来；分布有偏，且接近堵塞
+                                       覆盖率时会失败（此时改用 backtrack）
 --seed                  全局随机种子，用于复现结果
 --symprec               对称性去重容差（Å），高浓度非晶结构通常不需要
+                        两级去重：先比较空位-空位 MIC 距离的排序列表（逐项
+                        容差 2×symprec），只有与已有结构一致时才调用 spglib 比较
+                        (空间群, Wyckoff 计数) 指纹；指纹按空位集合 LRU 缓存
 --outdir                输出根目录，默认 amorphous_structures
 --max-attempts          单次 min-sep 约束最大重试次数，默认 5000
+                        （backtrack 模式下为最大回溯次数）
 --overlap-hard          硬截断系数，默认 0.5
                         原子对距离 < 系数 × (r_cov_i + r_cov_j) 时丢弃重试
                         共价半径自动从 ASE 内置表读取，无需手动指定
 --overlap-warn          软警告系数，默认 0.75，须大于 --overlap-hard
                         原子对距离 < 系数 × (r_cov_i + r_cov_j) 时保留结构
                         但在 summary.json 中记录违规原子对，方便事后筛查
+--repair-rounds         硬截断 overlap 局部修复的最大轮数，默认 0（关闭）
+                        开启后硬拒结构不再整体丢弃，而是只为违规原子重抽位移、
+                        只在其邻域内重新检查；仍有硬违规才丢弃重试。
+                        summary.json 中记录 repair_rounds / n_repaired_atoms
+--diversity-matrix-max  差异分析打印完整 Jaccard/MAD 矩阵的最大结构数，默认 20
+                        超过时打印全部结构对的聚合统计（均值/分位数/范围）和
+                        均匀抽样结构的子矩阵，summary.json 同样只记录抽样矩阵
+--diversity-memmap      差异分析的坐标缓冲区 (nstruct, N, 3) 放在输出目录下的
+                        临时 memmap 文件中，分析结束后自动删除
+--journal               写出断点续算日志 outdir/journal.jsonl（默认不写）；
+                        outdir 中已有日志时拒绝覆盖，请改用 --resume 或先删除
+--resume                断点续算：读取 outdir/journal.jsonl，恢复随机数流、去重集合
+                        与计数器，跳过已完成的浓度，从中断处继续；须使用与原运行
+                        相同的参数（--workers 与差异分析选项可以不同）。原运行须带
+                        --journal 或 --resume；找不到日志时从头开始并写出新日志
+--workers               并行生成候选结构的进程数，默认 1（串行）
+                        候选种子仍按顺序从全局随机数流中抽取，去重和写出在
+                        主进程按种子顺序进行，输出与串行运行逐位一致
+--bundle                tar | zip，每个浓度的 POSCAR 写入单个 structures.tar/.zip，
+                        成员名仍为 struct_000/POSCAR 等，summary.json 的 folder
+                        字段不变；大批量生成时避免大量小文件，不能与 --journal/--resume 同用
 
 输出目录结构
 ------------
@@ -92,6 +127,7 @@ gen_amorphous.py — 非晶初始结构生成器
     ├── struct_000/POSCAR
     ├── struct_001/POSCAR
     ├── struct_002/POSCAR
+    ├── journal.jsonl             ← 仅 --journal / --resume 时写出
     └── summary.json
 
   扫描模式：
@@ -103,12 +139,16 @@ gen_amorphous.py — 非晶初始结构生成器
     │   └── summary.json          ← 该浓度的详细记录
     ├── conc_25.0%/
     │   └── ...
+    ├── journal.jsonl             ← 断点续算日志（只追加，仅 --journal / --resume 时写出）
     └── scan_summary.json         ← 所有浓度的汇总表
 
 注意事项
 --------
-1. 高浓度（>37.5%）时建议不设 --min-sep，否则约束难以满足。
-2. overlap 硬拒率高时（脚本会提示），可尝试减小 --rattle 或 --overlap-hard。
+1. 高浓度（>37.5%）时建议不设 --min-sep，否则约束难以满足；
+   确需 min-sep 时使用 --min-sep-method backtrack（默认的 rejection 在高浓度下
+   几乎无法满足约束）。
+2. overlap 硬拒率高时（脚本会提示），可尝试减小 --rattle 或 --overlap-hard，
+   或开启 --repair-rounds 局部修复。
 3. 建议 AIMD 使用高温退火（1500–2000 K）再淬火，而非直接在目标温度运行。
 4. summary.json 中的 n_atoms_after 可直接用于核对生成的 POSCAR 原子数。
 5. 软警告结构（overlap_status: warn）仍可提交 AIMD，VASP 通常能处理，
@@ -118,14 +158,18 @@ gen_amorphous.py — 非晶初始结构生成器
 import argparse
 import json
 import sys
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
 from ase.data import covalent_radii, atomic_numbers
-from ase.io import read, write
+from ase.io import read
 from ase.neighborlist import neighbor_list
 
+from poscar_writer import BUNDLE_FORMATS, PoscarBundle, symbol_count_after_removal
+
 
 # ---------------------------------------------------------------------------
 # 参数解析与校验
@@ -161,12 +205,30 @@ def parse_args():
                         help="对称性去重容差（Å），非晶结构通常不需要")
     parser.add_argument("--outdir", default="amorphous_structures",
                         help="输出根目录，默认 amorphous_structures")
+    parser.add_argument("--min-sep-method", default="rejection",
+                        choices=["rejection", "backtrack", "sequential"],
+                        help="min-sep 采样方式，默认 rejection（严格均匀，与旧版种子结果一致）；"
+                             "高浓度时改用 backtrack")
     parser.add_argument("--max-attempts", type=int, default=5000,
                         help="单次 min-sep 约束最大重试次数，默认 5000")
     parser.add_argument("--overlap-hard", type=float, default=0.5,
                         help="硬截断系数（默认 0.5）：距离 < 系数×共价半径和时丢弃重试")
     parser.add_argument("--overlap-warn", type=float, default=0.75,
                         help="软警告系数（默认 0.75，须 > --overlap-hard）")
+    parser.add_argument("--repair-rounds", type=int, default=0,
+                        help="硬截断 overlap 局部修复的最大轮数，默认 0（不修复，直接丢弃重试）")
+    parser.add_argument("--diversity-matrix-max", type=int, default=20,
+                        help="差异分析打印完整矩阵的最大结构数，超过则输出聚合统计+抽样矩阵，默认 20")
+    parser.add_argument("--diversity-memmap", action="store_true",
+                        help="差异分析的坐标缓冲区放在磁盘 memmap 上（大超胞 × 大 --nstruct 时节省内存）")
+    parser.add_argument("--journal", action="store_true",
+                        help="写出断点续算日志 outdir/journal.jsonl，之后可用 --resume 续算")
+    parser.add_argument("--resume", action="store_true",
+                        help="从 outdir 下的 journal.jsonl 断点续算，输出与不中断运行一致")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="并行生成候选结构的进程数，默认 1（串行），结果与串行一致")
+    parser.add_argument("--bundle", choices=BUNDLE_FORMATS, default=None,
+                        help="将每个浓度的 POSCAR 打包为单个 structures.tar/.zip，不建 struct_* 目录")
     return parser.parse_args()
 
 
@@ -193,6 +255,14 @@ def validate_args(args):
         errors.append(f"--nstruct 须 >= 1，当前值：{args.nstruct}")
     if args.max_attempts < 1:
         errors.append(f"--max-attempts 须 >= 1，当前值：{args.max_attempts}")
+    if args.diversity_matrix_max < 2:
+        errors.append(f"--diversity-matrix-max 须 >= 2，当前值：{args.diversity_matrix_max}")
+    if args.repair_rounds < 0:
+        errors.append(f"--repair-rounds 须 >= 0，当前值：{args.repair_rounds}")
+    if args.workers < 1:
+        errors.append(f"--workers 须 >= 1，当前值：{args.workers}")
+    if args.bundle is not None and (args.resume or args.journal):
+        errors.append("--bundle 与 --journal/--resume 不能同时使用（续算需要从 struct_*/POSCAR 读回已生成结构）")
     # 提前校验浓度范围，避免在计算阶段才报错
     # mutually_exclusive_group(required=True) 保证两者恰好有一个非 None
     conc_list = args.scan_concentration if args.scan_concentration is not None \
@@ -273,8 +343,104 @@ def check_min_sep(atoms, indices, min_sep):
     return float(dist.min()) >= min_sep
 
 
-def choose_sites(atoms, indices_arr, n_vac, min_sep, rng, max_attempts):
-    """从目标元素位点中随机选取 n_vac 个空位，可选 min-sep 约束。"""
+def build_site_graph(atoms, indices_arr, min_sep):
+    """
+    预计算目标子晶格上的 min-sep 冲突图（CSR 格式），每个输入只构建一次。
+
+    用 ASE neighbor_list（周期性 cell list）在子晶格上搜索 min_sep 以内的位点对，
+    代替 check_min_sep 的 (n_vac, n_vac, 3) 稠密差矢张量。
+    位点与自身周期像的距离不计入冲突（与 check_min_sep 的 MIC 语义一致）。
+
+    返回 (indptr, neighbors)：子晶格位点 k 的冲突位点为
+    neighbors[indptr[k]:indptr[k+1]]（均为子晶格内的局部编号）。
+    """
+    sub = atoms[np.asarray(indices_arr, dtype=int)]
+    i_arr, j_arr = neighbor_list('ij', sub, min_sep)
+    distinct = i_arr != j_arr
+    i_arr, j_arr = i_arr[distinct], j_arr[distinct]
+    # 多个周期像可能给出重复的 (i, j)，去重后按 i 排序
+    pairs = np.unique(np.stack([i_arr, j_arr], axis=1), axis=0)
+    indptr = np.zeros(len(sub) + 1, dtype=int)
+    np.cumsum(np.bincount(pairs[:, 0], minlength=len(sub)), out=indptr[1:])
+    return indptr, pairs[:, 1].copy()
+
+
+def _sample_sequential(site_graph, n_sites, n_vac, rng, max_attempts):
+    """随机顺序逐个接受位点（RSA），被已选位点屏蔽的跳过；卡住则换新顺序重来。"""
+    indptr, neighbors = site_graph
+    for _ in range(max_attempts):
+        blocked = np.zeros(n_sites, dtype=bool)
+        chosen = []
+        for k in rng.permutation(n_sites).tolist():
+            if blocked[k]:
+                continue
+            chosen.append(k)
+            if len(chosen) == n_vac:
+                return chosen
+            blocked[neighbors[indptr[k]:indptr[k + 1]]] = True
+    return None
+
+
+def _sample_backtrack(site_graph, n_sites, n_vac, rng, max_attempts):
+    """
+    深度优先搜索：每步在未屏蔽位点中选"剩余自由邻居最少"者（随机打破平局），
+    走到死路时撤销最近一次选择并将其排除，再继续搜索，最多回溯 max_attempts 次。
+
+    最小度优先使每次选位屏蔽的位点最少，可越过 RSA 的堵塞覆盖率，
+    接近子晶格的最密排布；代价是高浓度时空位分布趋于有序。
+    """
+    indptr, neighbors = site_graph
+    tie = rng.random(n_sites)          # < 1，只在自由邻居数相同时起作用
+    blocked = np.zeros(n_sites, dtype=bool)
+    free_deg = np.diff(indptr).astype(float)
+    n_free = n_sites
+
+    def block(sites, log):
+        nonlocal n_free
+        for b in sites:
+            if not blocked[b]:
+                blocked[b] = True
+                n_free -= 1
+                free_deg[neighbors[indptr[b]:indptr[b + 1]]] -= 1
+                log.append(b)
+
+    def unblock(log):
+        nonlocal n_free
+        for b in reversed(log):
+            blocked[b] = False
+            n_free += 1
+            free_deg[neighbors[indptr[b]:indptr[b + 1]]] += 1
+
+    root_log = []
+    frames = []                        # 每层：(所选位点, 该层屏蔽的位点)
+    backtracks = 0
+    while len(frames) < n_vac:
+        if n_free >= n_vac - len(frames):
+            k = int(np.argmin(np.where(blocked, np.inf, free_deg + tie)))
+            log = []
+            block([k, *neighbors[indptr[k]:indptr[k + 1]].tolist()], log)
+            frames.append((k, log))
+            continue
+        if not frames or backtracks >= max_attempts:
+            return None
+        backtracks += 1
+        k, log = frames.pop()
+        unblock(log)
+        # 排除 k：记入上一层的屏蔽日志，上一层被撤销时一并恢复
+        block([k], frames[-1][1] if frames else root_log)
+    return [k for k, _ in frames]
+
+
+def choose_sites(atoms, indices_arr, n_vac, min_sep, rng, max_attempts,
+                 method="rejection", site_graph=None):
+    """从目标元素位点中随机选取 n_vac 个空位，可选 min-sep 约束。
+
+    min-sep 采样方式（method）：
+        rejection  : 整体随机抽取后用 check_min_sep 检查，失败重抽（严格均匀）
+        sequential : 基于 site_graph 随机顺序逐个选取（RSA），失败换顺序重来
+        backtrack  : 基于 site_graph 的最小度优先深度优先搜索，可回溯
+    后两者需要 build_site_graph 预先构建的冲突图。
+    """
     if n_vac > len(indices_arr):
         raise ValueError(
             f"请求空位数 ({n_vac}) 超过可用位点数 ({len(indices_arr)})。"
@@ -283,16 +449,26 @@ def choose_sites(atoms, indices_arr, n_vac, min_sep, rng, max_attempts):
         chosen = rng.choice(len(indices_arr), size=n_vac, replace=False)
         return sorted(int(indices_arr[i]) for i in chosen)
 
-    for _ in range(max_attempts):
-        chosen_idx = rng.choice(len(indices_arr), size=n_vac, replace=False)
-        trial = sorted(int(indices_arr[i]) for i in chosen_idx)
-        if check_min_sep(atoms, trial, min_sep):
-            return trial
+    if method == "rejection":
+        for _ in range(max_attempts):
+            chosen_idx = rng.choice(len(indices_arr), size=n_vac, replace=False)
+            trial = sorted(int(indices_arr[i]) for i in chosen_idx)
+            if check_min_sep(atoms, trial, min_sep):
+                return trial
+    else:
+        if site_graph is None:
+            site_graph = build_site_graph(atoms, indices_arr, min_sep)
+        sampler = _sample_sequential if method == "sequential" else _sample_backtrack
+        local = sampler(site_graph, len(indices_arr), n_vac, rng, max_attempts)
+        if local is not None:
+            return sorted(int(indices_arr[k]) for k in local)
 
     raise RuntimeError(
-        f"经过 {max_attempts} 次尝试，无法满足 --min-sep={min_sep:.2f} Å 约束。\n"
+        f"经过 {max_attempts} 次尝试，无法满足 --min-sep={min_sep:.2f} Å 约束"
+        f"（--min-sep-method {method}）。\n"
         f"  当前参数：n_vac={n_vac}，可用位点数={len(indices_arr)}\n"
-        f"  建议：去掉 --min-sep，或减小 --concentration，或增大超胞。"
+        f"  建议：改用 --min-sep-method backtrack，或去掉 --min-sep，"
+        f"或减小 --concentration，或增大超胞。"
     )
 
 
@@ -363,58 +539,248 @@ def build_hard_warn_cutoffs(symbols, hard_factor, warn_factor):
     return cutoffs, max_warn
 
 
-def check_overlap(atoms, cutoffs_by_pair, max_warn_cutoff, max_violations=200):
+def build_cutoff_matrix(cutoffs_by_pair):
+    """
+    将 build_hard_warn_cutoffs 的元素对字典转为按原子序数编码索引的对称矩阵，
+    供 check_overlap 做整批数组掩码分级。
+
+    返回 dict：
+        z_to_code : (119,) int 数组，原子序数 → 元素编码（未出现的元素为 -1）
+        symbols   : 元素编码 → 元素符号
+        hard      : (n_species, n_species) 硬截断距离
+        warn      : (n_species, n_species) 软警告距离
+    共价半径未知而被跳过的元素对，hard/warn 均置 0，永不触发。
+    """
+    symbols = sorted({s for pair in cutoffs_by_pair for s in pair})
+    code = {s: k for k, s in enumerate(symbols)}
+    z_to_code = np.full(len(covalent_radii), -1, dtype=int)
+    for s, k in code.items():
+        z_to_code[atomic_numbers[s]] = k
+    n = len(symbols)
+    hard = np.zeros((n, n))
+    warn = np.zeros((n, n))
+    for (s1, s2), (hard_d, warn_d) in cutoffs_by_pair.items():
+        k1, k2 = code[s1], code[s2]
+        hard[k1, k2] = hard[k2, k1] = hard_d
+        warn[k1, k2] = warn[k2, k1] = warn_d
+    return {"z_to_code": z_to_code, "symbols": symbols, "hard": hard, "warn": warn}
+
+
+def classify_pairs(codes, i_arr, j_arr, d_arr, cutoff_matrix):
+    """
+    对候选原子对做 hard/warn 分级，只保留违规对。
+
+    codes 为各原子的元素编码（cutoff_matrix["z_to_code"][atoms.numbers]），
+    不在截断表中的元素（理论上不应发生）跳过。返回 dict of arrays：
+        i, j, d : 违规对的原子索引与距离
+        ci, cj  : 对应元素编码
+        hard    : bool，是否为硬截断违规（否则为软警告）
+        limit   : 对应级别的截断距离
+    """
+    keep = (codes[i_arr] >= 0) & (codes[j_arr] >= 0)
+    i_arr, j_arr, d_arr = i_arr[keep], j_arr[keep], d_arr[keep]
+    ci, cj = codes[i_arr], codes[j_arr]
+    hard_arr = cutoff_matrix["hard"][ci, cj]
+    warn_arr = cutoff_matrix["warn"][ci, cj]
+
+    is_hard = d_arr < hard_arr
+    bad = is_hard | (d_arr < warn_arr)
+    return {
+        "i": i_arr[bad], "j": j_arr[bad], "d": d_arr[bad],
+        "ci": ci[bad], "cj": cj[bad],
+        "hard": is_hard[bad],
+        "limit": np.where(is_hard, hard_arr, warn_arr)[bad],
+    }
+
+
+def summarize_overlap(pairs, symbols, max_violations=200):
+    """由 classify_pairs 的违规对得到 (status, violations)，违规对按输入顺序截取。"""
+    if pairs["hard"].any():
+        worst = 'hard'
+    elif len(pairs["hard"]):
+        worst = 'warn'
+    else:
+        return 'ok', []
+
+    violations = []
+    for k in range(min(len(pairs["i"]), max_violations)):
+        entry = {
+            "atom_i": int(pairs["i"][k]), "sym_i": symbols[pairs["ci"][k]],
+            "atom_j": int(pairs["j"][k]), "sym_j": symbols[pairs["cj"][k]],
+            "distance": round(float(pairs["d"][k]), 4),
+        }
+        if pairs["hard"][k]:
+            entry["hard_limit"] = round(float(pairs["limit"][k]), 4)
+            entry["level"] = "hard"
+        else:
+            entry["warn_limit"] = round(float(pairs["limit"][k]), 4)
+            entry["level"] = "warn"
+        violations.append(entry)
+
+    return worst, violations
+
+
+def overlap_pairs(atoms, cutoff_matrix, max_warn_cutoff):
+    """全量 neighbor_list 搜索，返回 classify_pairs 格式的违规对（neighbor_list 顺序）。"""
+    i_arr, j_arr, d_arr = neighbor_list('ijd', atoms, max_warn_cutoff)
+    once = i_arr < j_arr          # 每对只检查一次
+    codes = cutoff_matrix["z_to_code"][atoms.numbers]
+    return classify_pairs(codes, i_arr[once], j_arr[once], d_arr[once], cutoff_matrix)
+
+
+def check_overlap(atoms, cutoff_matrix, max_warn_cutoff, max_violations=200):
     """
     用 ASE neighbor_list 高效检查 rattle 后的 overlap。
     比朴素 O(N²) 循环快一到两个数量级，适合大超胞。
 
+    分级全部以数组掩码完成：按元素编码从 cutoff_matrix 中 gather 每对的
+    hard/warn 距离，违规对按 neighbor_list 原始顺序截取前 max_violations 条。
+
     返回：
         status     : 'ok' | 'warn' | 'hard'
         violations : list of dict，记录违规原子对（最多 max_violations 条）
     """
-    symbols = atoms.get_chemical_symbols()
-    violations = []
-    worst = 'ok'
+    pairs = overlap_pairs(atoms, cutoff_matrix, max_warn_cutoff)
+    return summarize_overlap(pairs, cutoff_matrix["symbols"], max_violations)
 
-    i_list, j_list, d_list = neighbor_list('ijd', atoms, max_warn_cutoff)
 
-    for i, j, d in zip(i_list, j_list, d_list):
-        if i >= j:      # 每对只检查一次
-            continue
-        s1, s2 = symbols[i], symbols[j]
-        key = tuple(sorted([s1, s2]))
-        pair_cutoffs = cutoffs_by_pair.get(key)
-        if pair_cutoffs is None:
-            # 理论上不应发生（cutoffs 由原始结构全元素集构建），
-            # 若遇到则跳过，避免 KeyError 中断运行
+# ---------------------------------------------------------------------------
+# 母胞原子对骨架（所有候选共用）
+# ---------------------------------------------------------------------------
+#
+# 每个候选都是同一母胞删去少量原子再 rattle，rattle 位移每个分量不超过 amplitude，
+# 即每个原子位移模长不超过 √3·amplitude。因此 rattle 后距离 < max_warn_cutoff 的
+# 原子对，在母胞中的距离必然 < max_warn_cutoff + 2√3·amplitude。
+# 在 main() 中对母胞做一次 neighbor_list，之后每个候选只需掩掉被删原子、
+# 按 rattle 后坐标重新计算这些原子对的距离（一次向量化 gather），不再重建邻居表。
+
+def build_pair_skeleton(atoms, cutoff_matrix, max_warn_cutoff, amplitude):
+    """
+    预计算母胞中可能在 rattle 后进入 max_warn_cutoff 的全部原子对。
+
+    返回 dict：
+        i, j     : 母胞原子索引（i < j，按 (i, j) 排序）
+        shift    : (n_pairs, 3) 周期平移向量 S·cell（Å），与 neighbor_list 的 D 定义一致
+        codes    : 母胞各原子的元素编码
+        cutoff   : 骨架搜索半径
+        adj_ptr, adj_pairs : 每个母胞原子参与的原子对序号（CSR），
+                             原子 a 的为 adj_pairs[adj_ptr[a]:adj_ptr[a + 1]]
+    """
+    # rattle 和局部修复的位移都从 Uniform(-amplitude, amplitude) 逐分量抽样
+    cutoff = max_warn_cutoff + 2.0 * np.sqrt(3.0) * max(amplitude, 0.0)
+    i_arr, j_arr, s_arr = neighbor_list('ijS', atoms, cutoff)
+    codes = cutoff_matrix["z_to_code"][atoms.numbers]
+    keep = (i_arr < j_arr) & (codes[i_arr] >= 0) & (codes[j_arr] >= 0)
+    i_arr, j_arr, s_arr = i_arr[keep], j_arr[keep], s_arr[keep]
+    order = np.lexsort((j_arr, i_arr))
+    i_arr, j_arr, s_arr = i_arr[order], j_arr[order], s_arr[order]
+    ends = np.concatenate([i_arr, j_arr])
+    by_atom = np.argsort(ends, kind="stable")
+    return {
+        "i": i_arr,
+        "j": j_arr,
+        "shift": s_arr @ atoms.cell[:],
+        "codes": codes,
+        "cutoff": cutoff,
+        "adj_ptr": np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=len(atoms)))]),
+        "adj_pairs": by_atom % len(i_arr) if len(i_arr) else by_atom,
+    }
+
+
+def skeleton_pairs(skeleton, removed, positions, cutoff_matrix):
+    """
+    用母胞骨架计算候选结构的违规原子对（classify_pairs 格式，按 (i, j) 排序）。
+
+    removed   : 被删除的母胞原子索引
+    positions : rattle 后空位结构的坐标（原子顺序为母胞删去 removed 后的顺序）
+    """
+    codes = skeleton["codes"]
+    mask = np.ones(len(codes), dtype=bool)
+    mask[np.asarray(removed, dtype=int)] = False
+    new_index = np.cumsum(mask) - 1           # 母胞索引 → 空位结构索引（保序）
+    keep = mask[skeleton["i"]] & mask[skeleton["j"]]
+    ni = new_index[skeleton["i"][keep]]
+    nj = new_index[skeleton["j"][keep]]
+    d = np.linalg.norm(positions[nj] - positions[ni] + skeleton["shift"][keep], axis=1)
+    return classify_pairs(codes[mask], ni, nj, d, cutoff_matrix)
+
+
+def skeleton_incident_pairs(skeleton, parent_atoms, alive, new_index, positions):
+    """
+    母胞原子 parent_atoms 参与的骨架原子对（两端都未被删除，每对一次，按 (i, j) 排序）。
+    只查这些原子的邻接表，代价与 parent_atoms 的邻居数成正比。
+    返回空位结构中的 (i, j, d)。
+    """
+    ptr, adj = skeleton["adj_ptr"], skeleton["adj_pairs"]
+    ids = np.unique(np.concatenate(
+        [adj[ptr[a]:ptr[a + 1]] for a in parent_atoms.tolist()] + [adj[:0]]))
+    i, j = skeleton["i"][ids], skeleton["j"][ids]
+    keep = alive[i] & alive[j]
+    ni, nj = new_index[i[keep]], new_index[j[keep]]
+    d = np.linalg.norm(positions[nj] - positions[ni] + skeleton["shift"][ids[keep]], axis=1)
+    return ni, nj, d
+
+
+# ---------------------------------------------------------------------------
+# Overlap 局部修复（可选，--repair-rounds）
+# ---------------------------------------------------------------------------
+#
+# 硬截断违规通常只涉及少数原子。修复模式保留违规对表，只为违规原子重抽位移，
+# 并只重算这些原子在母胞骨架（build_pair_skeleton）中的原子对：修复位移与 rattle
+# 同分布，骨架已覆盖修复后可能进入截断的全部原子对，每轮代价 O(k) 而非 O(N)。
+
+def repair_overlap(base, rattled, amplitude, rng, cutoff_matrix, max_warn_cutoff,
+                   max_rounds, max_violations=200, pairs=None, skeleton=None, removed=()):
+    """
+    对硬截断违规原子局部重抽位移，直到无硬违规或达到 max_rounds 轮。
+
+    base     : rattle 前的空位结构（位移以此为基准重新抽样）
+    rattled  : 已 rattle 的结构（不修改，返回新对象）
+    pairs    : rattled 的违规对（classify_pairs 格式），已算过时传入以免重复搜索
+    skeleton : 母胞骨架（build_pair_skeleton，amplitude 不小于本次位移幅度），
+               removed 为被删除的母胞原子索引；不给出时每轮退回全量检查
+    返回 (atoms, status, violations, n_rounds, n_redrawn)。
+    """
+    atoms = rattled.copy()
+    pos = atoms.positions                       # 原地修改 atoms 的坐标数组
+    base_pos = base.positions
+    codes = cutoff_matrix["z_to_code"][atoms.numbers]
+    symbols = cutoff_matrix["symbols"]
+    if pairs is None:
+        pairs = overlap_pairs(atoms, cutoff_matrix, max_warn_cutoff)
+    if skeleton is not None:
+        alive = np.ones(len(skeleton["codes"]), dtype=bool)
+        alive[np.asarray(removed, dtype=int)] = False
+        new_index = np.cumsum(alive) - 1          # 母胞索引 → 空位结构索引
+        parent_of = np.flatnonzero(alive)         # 空位结构索引 → 母胞索引
+
+    n_rounds = 0
+    n_redrawn = 0
+    while pairs["hard"].any() and n_rounds < max_rounds:
+        n_rounds += 1
+        bad = np.unique(np.concatenate([pairs["i"][pairs["hard"]],
+                                        pairs["j"][pairs["hard"]]]))
+        n_redrawn += len(bad)
+        pos[bad] = base_pos[bad] + rng.uniform(-amplitude, amplitude, size=(len(bad), 3))
+
+        if skeleton is None:
+            # 无骨架：退回全量检查，仍省去选位/删原子/对称性的重建开销
+            pairs = overlap_pairs(atoms, cutoff_matrix, max_warn_cutoff)
             continue
-        hard_d, warn_d = pair_cutoffs
-
-        if d < hard_d:
-            if len(violations) < max_violations:
-                violations.append({
-                    "atom_i": int(i), "sym_i": s1,
-                    "atom_j": int(j), "sym_j": s2,
-                    "distance": round(float(d), 4),
-                    "hard_limit": round(hard_d, 4),
-                    "level": "hard",
-                })
-            worst = 'hard'
-            # 继续遍历以确保 worst 反映真实最坏情况；
-            # violations 列表超过上限后停止追加，但不退出循环。
-        elif d < warn_d:
-            if len(violations) < max_violations:
-                violations.append({
-                    "atom_i": int(i), "sym_i": s1,
-                    "atom_j": int(j), "sym_j": s2,
-                    "distance": round(float(d), 4),
-                    "warn_limit": round(warn_d, 4),
-                    "level": "warn",
-                })
-            if worst != 'hard':
-                worst = 'warn'
 
-    return worst, violations
+        # 丢弃涉及被移动原子的旧违规对，再只重算它们在骨架中的原子对
+        moved = np.zeros(len(atoms), dtype=bool)
+        moved[bad] = True
+        stale = moved[pairs["i"]] | moved[pairs["j"]]
+        kept = {k: v[~stale] for k, v in pairs.items()}
+        fresh = classify_pairs(codes, *skeleton_incident_pairs(
+            skeleton, parent_of[bad], alive, new_index, pos), cutoff_matrix)
+        pairs = {k: np.concatenate([kept[k], fresh[k]]) for k in pairs}
+        order = np.lexsort((pairs["j"], pairs["i"]))   # 与 skeleton_pairs 相同的 (i, j) 顺序
+        pairs = {k: v[order] for k, v in pairs.items()}
+
+    status, violations = summarize_overlap(pairs, symbols, max_violations)
+    return atoms, status, violations, n_rounds, n_redrawn
 
 
 # ---------------------------------------------------------------------------
@@ -448,109 +814,237 @@ def get_symmetry_fingerprint(atoms, symprec, spglib):
     return (sg, wk_count)
 
 
+# 两级去重：对称等价的空位构型在母晶格上具有（容差内）相同的空位-空位 MIC 距离多重集，
+# 因此先比较这一廉价不变量；只有不变量与已见结构在容差内一致时才调用 spglib，
+# 且指纹按空位集合缓存（LRU），同一输入重复出现的空位集合不再重算。
+# 不变量按距离和分桶，查找时同时探测相邻桶，避免相近的值恰好落在桶边界两侧而漏检。
+
+def vacancy_invariant(atoms, chosen, tol):
+    """
+    空位-空位 MIC 距离的升序数组，在母晶格（rattle 前）坐标上计算。
+    母晶格在 tol 精度内对称时，对称等价的空位集合给出逐项相差不超过 2*tol 的数组
+    （比较见 invariant_matches）；tol 过小或结构偏离对称时可能漏判为不同，只影响去重率。
+    """
+    pos = atoms.positions[np.asarray(chosen, dtype=int)]
+    if len(pos) < 2:
+        return np.empty(0)
+    cell = atoms.cell[:]
+    inv_cell = np.linalg.inv(cell)
+    dists = []
+    for i in range(len(pos) - 1):
+        frac = (pos[i + 1:] - pos[i]) @ inv_cell
+        frac -= np.round(frac)
+        dists.append(np.linalg.norm(frac @ cell, axis=1))
+    return np.sort(np.concatenate(dists))
+
+
+def _invariant_bucket(invariant, tol):
+    """距离和的桶号；桶宽取 2*tol*距离个数，逐项相差 ≤ 2*tol 的两个不变量桶号至多相差 1。"""
+    width = 2 * tol * max(len(invariant), 1)
+    return len(invariant), int(np.floor(invariant.sum() / width))
+
+
+def invariant_matches(seen, invariant, tol):
+    """
+    seen 为 {桶号: [(不变量, 空位集合), ...]}；返回不变量与 invariant
+    逐项相差不超过 2*tol 的已见空位集合（探测本桶与相邻两桶）。
+    """
+    n, k = _invariant_bucket(invariant, tol)
+    return [key
+            for kk in (k - 1, k, k + 1)
+            for other, key in seen.get((n, kk), ())
+            if np.allclose(other, invariant, rtol=0, atol=2 * tol)]
+
+
+def add_invariant(seen, invariant, config_key, tol):
+    """把已接受的空位集合登记到 invariant_matches 使用的分桶表中。"""
+    seen.setdefault(_invariant_bucket(invariant, tol), []).append((invariant, config_key))
+
+
+def make_symkey_lookup(atoms, symprec, spglib, maxsize=4096):
+    """
+    返回按空位集合（排序后的索引元组）缓存的对称指纹查询函数。
+    查询函数的 cache_info().misses 即 spglib 实际调用次数。
+    """
+    @lru_cache(maxsize=maxsize)
+    def lookup(config_key):
+        return get_symmetry_fingerprint(remove_atoms(atoms, config_key), symprec, spglib)
+    return lookup
+
+
 # ---------------------------------------------------------------------------
 # 结构差异分析
 # ---------------------------------------------------------------------------
 
-def vacancy_jaccard(chosen_a, chosen_b):
+# 生成过程中只保留两类紧凑数据，而非完整 Atoms 对象：
+#   vac : (nstruct, n_target) 布尔矩阵，记录每个结构删除了哪些目标位点
+#   pos : (nstruct, N, 3) rattle 后坐标，可选放在磁盘 memmap 上
+# Jaccard 由一次布尔矩阵乘积得到，MAD 按行分块批量计算，内存与 nstruct 线性相关。
+
+def new_diversity_buffer(n_max, n_atoms, atoms, target_indices_arr, memmap_path=None):
+    """为一个浓度分配差异分析缓冲区；memmap_path 非空时坐标数组放在磁盘上。"""
+    site_col = np.full(len(atoms), -1, dtype=int)
+    site_col[np.asarray(target_indices_arr, dtype=int)] = np.arange(len(target_indices_arr))
+    if memmap_path is not None:
+        pos = np.lib.format.open_memmap(
+            memmap_path, mode="w+", dtype=np.float64, shape=(n_max, n_atoms, 3)
+        )
+    else:
+        pos = np.empty((n_max, n_atoms, 3))
+    return {
+        "n": 0,
+        "cell": atoms.cell[:],
+        "site_col": site_col,
+        "vac": np.zeros((n_max, len(target_indices_arr)), dtype=bool),
+        "pos": pos,
+        "memmap_path": memmap_path,
+    }
+
+
+def diversity_add(buf, atoms, removed_indices):
+    """记录一个已生成结构的空位位点与坐标。"""
+    k = buf["n"]
+    buf["vac"][k, buf["site_col"][removed_indices]] = True
+    buf["pos"][k] = atoms.positions
+    buf["n"] = k + 1
+
+
+def diversity_release(buf):
+    """释放缓冲区并删除 memmap 临时文件。"""
+    path = buf.pop("memmap_path", None)
+    buf.pop("pos", None)
+    if path is not None:
+        Path(path).unlink(missing_ok=True)
+
+
+def jaccard_matrix(vac):
     """
-    计算两个空位集合的 Jaccard 距离（0 = 完全相同，1 = 完全不同）。
+    空位集合两两 Jaccard 距离（0 = 完全相同，1 = 完全不同），由一次矩阵乘积得到。
     反映空位位点选取的多样性，与原子位置无关。
     """
-    set_a, set_b = set(chosen_a), set(chosen_b)
-    union = len(set_a | set_b)
-    if union == 0:
-        # 防御性保护：compute_n_vac 已保证 n_vac >= 1，此分支理论上不可达。
-        return 0.0
-    return round(1.0 - len(set_a & set_b) / union, 4)
+    v = vac.astype(np.int64)
+    inter = v @ v.T
+    size = v.sum(axis=1)
+    union = size[:, None] + size[None, :] - inter
+    # compute_n_vac 保证 n_vac >= 1，union 不会为 0；防御性地按相同处理
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jac = np.where(union > 0, 1.0 - inter / union, 0.0)
+    return np.round(jac, 4)
 
 
-def mean_atomic_displacement(atoms_a, atoms_b):
+def mad_matrix(pos, cell, chunk_bytes=64 * 2**20):
     """
-    计算两个结构间的平均原子位移 MAD（Ang，mic）。
-    原子按索引一一对应（删除相同空位后顺序一致时有效）。
-    反映 rattle 后原子位置的差异程度。
-
-    若原子数不等或晶胞奇异（如真空层导致行列式极小），返回 None。
+    两两平均原子位移 MAD（Å，mic），原子按索引一一对应。
+    反映 rattle 后原子位置的差异程度。按行分块批量计算，
+    每块差矢数组不超过 chunk_bytes。晶胞奇异时返回 None。
     """
-    if len(atoms_a) != len(atoms_b):
-        return None
-    diff = atoms_b.get_positions() - atoms_a.get_positions()
-    cell = atoms_a.cell[:]
+    n, n_atoms = pos.shape[:2]
     try:
         # 正确的笛卡尔→分数坐标：r_frac = r_cart @ inv(cell)
-        frac = diff @ np.linalg.inv(cell)
+        inv_cell = np.linalg.inv(cell)
     except np.linalg.LinAlgError:
-        return None   # 奇异晶胞，无法计算 MIC，降级返回 None
-    frac -= np.round(frac)
-    cart = frac @ cell
-    return round(float(np.mean(np.linalg.norm(cart, axis=1))), 4)
+        return None   # 奇异晶胞（如真空层导致行列式极小），无法计算 MIC
+    mad = np.zeros((n, n))
+    rows = max(1, chunk_bytes // (n_atoms * 3 * 8))
+    for i in range(n - 1):
+        pi = np.asarray(pos[i])
+        for j0 in range(i + 1, n, rows):
+            j1 = min(n, j0 + rows)
+            frac = (np.asarray(pos[j0:j1]) - pi) @ inv_cell
+            frac -= np.round(frac)
+            vals = np.mean(np.linalg.norm(frac @ cell, axis=-1), axis=1)
+            mad[i, j0:j1] = mad[j0:j1, i] = np.round(vals, 4)
+    return mad
+
+
+def _upper_stats(mat):
+    """上三角（不含对角）元素的聚合统计。"""
+    vals = mat[np.triu_indices(len(mat), k=1)]
+    q05, q50, q95 = np.percentile(vals, [5, 50, 95])
+    return {
+        "mean": round(sum(vals.tolist()) / len(vals), 4),
+        "std": round(float(np.std(vals)), 4),
+        "min": round(float(vals.min()), 4),
+        "p05": round(float(q05), 4),
+        "median": round(float(q50), 4),
+        "p95": round(float(q95), 4),
+        "max": round(float(vals.max()), 4),
+    }
 
 
-def compute_and_print_diversity(structures_info, atoms_list):
+def compute_and_print_diversity(structures_info, buf, max_matrix=20):
     """
     对同一浓度下所有生成结构做两两差异分析，打印矩阵并返回统计结果。
 
     Jaccard 距离：衡量空位位点的差异（0 = 完全相同，1 = 完全不同）
     MAD：衡量 rattle 后原子位置的差异（Å）
 
+    结构数超过 max_matrix 时，只打印/记录均匀抽样的 max_matrix 个结构的
+    子矩阵，另给出全部结构对的聚合统计。
     结果同时写入 summary.json 的 diversity 字段。
     """
-    n = len(structures_info)
+    n = buf["n"]
     if n < 2:
         return None
 
-    jac_mat = [[0.0] * n for _ in range(n)]
-    mad_mat = [[0.0] * n for _ in range(n)]    # JSON 输出用，对角线和降级对均为 0.0
-    mad_valid = [[False] * n for _ in range(n)]  # 标记哪些非对角对有有效 MAD 值
+    jac_mat = jaccard_matrix(buf["vac"][:n])
+    mad_mat = mad_matrix(buf["pos"][:n], buf["cell"])
+    mad_valid = mad_mat is not None
+    if not mad_valid:
+        mad_mat = np.zeros((n, n))   # JSON 输出用，降级时全为 0.0
+
+    jac_stats = _upper_stats(jac_mat)
+    jac_mean = jac_stats["mean"]
+    mad_stats = _upper_stats(mad_mat) if mad_valid else None
+    mad_mean = mad_stats["mean"] if mad_valid else 0.0
+
+    sampled = n > max_matrix
+    if sampled:
+        show = np.unique(np.linspace(0, n - 1, max_matrix).round().astype(int))
+    else:
+        show = np.arange(n)
+    m = len(show)
+    ids = [f"s{structures_info[k]['id']:03d}" for k in show]
+    jac_show = jac_mat[np.ix_(show, show)]
+    mad_show = mad_mat[np.ix_(show, show)]
 
-    for i in range(n):
-        for j in range(i + 1, n):
-            jac = vacancy_jaccard(
-                structures_info[i]["removed_indices"],
-                structures_info[j]["removed_indices"],
-            )
-            mad = mean_atomic_displacement(atoms_list[i], atoms_list[j])
-            jac_mat[i][j] = jac_mat[j][i] = jac
-            if mad is not None:
-                mad_mat[i][j] = mad_mat[j][i] = mad
-                mad_valid[i][j] = mad_valid[j][i] = True
-
-    upper = [(i, j) for i in range(n) for j in range(i + 1, n)]
-    jac_mean = round(sum(jac_mat[i][j] for i, j in upper) / len(upper), 4)
-    # 只统计有效（mad_valid 为 True）的 MAD 对，避免降级的 0.0 稀释均值
-    mad_vals = [mad_mat[i][j] for i, j in upper if mad_valid[i][j]]
-    mad_mean = round(sum(mad_vals) / len(mad_vals), 4) if mad_vals else 0.0
-
-    ids = [f"s{e['id']:03d}" for e in structures_info]
     w = 56
     print(f"\n  {'─'*w}")
     print(f"  结构差异分析（共 {n} 个结构）")
     print(f"  {'─'*w}")
+    if sampled:
+        print(f"  结构数超过 {max_matrix}，以下矩阵为均匀抽样的 {m} 个结构，"
+              f"均值等统计基于全部结构对。")
 
     # Jaccard 矩阵
     print(f"  Jaccard 距离（空位位点差异，1 = 完全不同）：")
-    header = "         " + "  ".join(f"{ids[j]:>6}" for j in range(n))
+    header = "         " + "  ".join(f"{ids[j]:>6}" for j in range(m))
     print(f"  {header}")
-    for i in range(n):
-        row = "  ".join("  ----" if i == j else f"{jac_mat[i][j]:>6.3f}" for j in range(n))
+    for i in range(m):
+        row = "  ".join("  ----" if i == j else f"{jac_show[i][j]:>6.3f}" for j in range(m))
         print(f"  {ids[i]:>6}   {row}")
+    if sampled:
+        print(f"  范围: [{jac_stats['min']:.3f}, {jac_stats['max']:.3f}]  "
+              f"中位数: {jac_stats['median']:.3f}")
     print(f"  均值: {jac_mean:.3f}", end="")
     if jac_mean < 0.3:
         print("  ⚠ 空位分布相似度较高，建议增加 --nstruct 或检查随机种子")
     else:
         print("  ✓ 空位分布多样，结构独立性良好")
 
-    # MAD 矩阵（mad_valid[i][j]=False 表示降级无效，显示为 N/A）
+    # MAD 矩阵（晶胞奇异无法计算 MIC 时显示为 N/A）
     print(f"\n  平均原子位移 MAD（Å，反映 rattle 后位置差异）：")
     print(f"  {header}")
-    for i in range(n):
+    for i in range(m):
         row = "  ".join(
             "  ----" if i == j
-            else ("   N/A" if not mad_valid[i][j] else f"{mad_mat[i][j]:>6.3f}")
-            for j in range(n)
+            else ("   N/A" if not mad_valid else f"{mad_show[i][j]:>6.3f}")
+            for j in range(m)
         )
         print(f"  {ids[i]:>6}   {row}")
+    if sampled and mad_valid:
+        print(f"  范围: [{mad_stats['min']:.3f}, {mad_stats['max']:.3f}] Å  "
+              f"中位数: {mad_stats['median']:.3f} Å")
     print(f"  均值: {mad_mean:.3f} Å", end="")
     if mad_mean < 0.1:
         print("  ⚠ 原子位置差异较小，结构可能过于相似")
@@ -558,24 +1052,207 @@ def compute_and_print_diversity(structures_info, atoms_list):
         print("  ✓ 原子位置存在显著差异，可作为独立 AIMD 初始构型")
     print(f"  {'─'*w}\n")
 
-    return {
-        "jaccard_matrix": jac_mat,
-        "mad_matrix": mad_mat,
+    result = {
+        "jaccard_matrix": jac_show.tolist(),
+        "mad_matrix": mad_show.tolist(),
         "jaccard_mean": jac_mean,
         "mad_mean": mad_mean,
     }
+    if sampled:
+        result["matrix_ids"] = [int(structures_info[k]["id"]) for k in show]
+        result["jaccard_stats"] = jac_stats
+        result["mad_stats"] = mad_stats
+    return result
+
+
+# ---------------------------------------------------------------------------
+# 候选结构构造（串行与进程池共用）
+# ---------------------------------------------------------------------------
+#
+# 每个候选结构完全由其种子决定：choose_sites → remove_atoms → 对称不变量 →
+# rattle_atoms → check_overlap 只消耗由该种子构造的局部 rng，去重判断不消耗
+# 随机数。因此候选可以在任意进程中提前构造，只要主进程按种子顺序消费结果、
+# 按串行时的同一套规则做去重/计数，输出就与串行运行逐位一致。
+#
+# 串行模式下各阶段按需惰性执行（配置重复时不做 rattle / overlap），
+# 并行模式下工作进程一次性执行全部阶段。spglib 指纹只在不变量碰撞时
+# 由主进程按需查询（带 LRU 缓存），不在工作进程中计算。
+
+def draw_candidate(ctx, seed, n_vac):
+    """用种子 seed 选取空位位点，返回候选 dict（min-sep 失败时含 error 字段）。"""
+    rng = np.random.default_rng(seed)
+    cand = {"seed": seed, "rng": rng}
+    try:
+        cand["chosen"] = choose_sites(
+            ctx["atoms"], ctx["target_indices_arr"], n_vac,
+            ctx["args"].min_sep, rng, ctx["args"].max_attempts,
+            method=ctx["args"].min_sep_method, site_graph=ctx["site_graph"],
+        )
+    except RuntimeError as e:
+        cand["error"] = str(e)
+    return cand
+
+
+def candidate_invariant(ctx, cand):
+    """计算空位集合的廉价对称不变量（vacancy_invariant），结果缓存在 cand 中。"""
+    if "invariant" not in cand:
+        cand["invariant"] = vacancy_invariant(
+            ctx["atoms"], cand["chosen"], ctx["args"].symprec
+        )
+    return cand["invariant"]
+
+
+def candidate_rattled(ctx, cand):
+    """对空位结构施加 rattle 并做 overlap 检查，返回 (rattled, status, violations)。"""
+    if "rattled" not in cand:
+        if "defect" not in cand:
+            cand["defect"] = remove_atoms(ctx["atoms"], cand["chosen"])
+        # rattle_atoms 内部做拷贝，不修改 defect 原对象
+        cand["rattled"] = rattle_atoms(cand["defect"], ctx["args"].rattle, cand["rng"])
+        if ctx["pair_skeleton"] is not None:
+            pairs = skeleton_pairs(ctx["pair_skeleton"], cand["chosen"],
+                                   cand["rattled"].positions, ctx["cutoff_matrix"])
+        else:
+            pairs = overlap_pairs(cand["rattled"], ctx["cutoff_matrix"], ctx["max_warn_cutoff"])
+        cand["overlap_status"], cand["violations"] = summarize_overlap(
+            pairs, ctx["cutoff_matrix"]["symbols"]
+        )
+        cand["repair_rounds"] = 0
+        if cand["overlap_status"] == 'hard' and ctx["args"].repair_rounds > 0:
+            (cand["rattled"], cand["overlap_status"], cand["violations"],
+             cand["repair_rounds"], cand["n_repaired_atoms"]) = repair_overlap(
+                cand["defect"], cand["rattled"], ctx["args"].rattle, cand["rng"],
+                ctx["cutoff_matrix"], ctx["max_warn_cutoff"], ctx["args"].repair_rounds,
+                pairs=pairs, skeleton=ctx["pair_skeleton"], removed=cand["chosen"],
+            )
+    return cand["rattled"], cand["overlap_status"], cand["violations"]
+
+
+def serial_candidates(ctx, master_rng, n_vac):
+    """串行候选源：每次从 master_rng 抽一个种子，阶段由消费方按需执行。"""
+    while True:
+        seed = int(master_rng.integers(0, 10**9))
+        yield draw_candidate(ctx, seed, n_vac)
+
+
+_WORKER_CTX = None
+
+
+def _init_worker(ctx):
+    """进程池初始化：每个工作进程只接收一次输入结构与截断表。"""
+    global _WORKER_CTX
+    _WORKER_CTX = ctx
+
+
+def _build_candidate_worker(seed, n_vac):
+    """工作进程入口：一次性完成全部阶段，去掉无需回传的中间对象。"""
+    ctx = _WORKER_CTX
+    cand = draw_candidate(ctx, seed, n_vac)
+    if "error" not in cand:
+        if ctx["args"].symprec is not None:
+            candidate_invariant(ctx, cand)
+        candidate_rattled(ctx, cand)
+        del cand["defect"]
+    del cand["rng"]
+    return cand
+
+
+def parallel_candidates(executor, master_rng, n_vac, window):
+    """
+    并行候选源：按顺序从 master_rng 抽取种子并提前提交最多 window 个任务，
+    按提交顺序返回结果。提前抽取的种子会多消耗 master_rng，
+    调用方须在结束后按实际消费数恢复 master_rng 状态。
+    """
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < window:
+                seed = int(master_rng.integers(0, 10**9))
+                pending.append(executor.submit(_build_candidate_worker, seed, n_vac))
+            yield pending.popleft().result()
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+# ---------------------------------------------------------------------------
+# 断点续算日志（journal.jsonl，只追加）
+# ---------------------------------------------------------------------------
+#
+# 每个被消费的候选写一行记录（种子、去重/拒绝结果、空位集合、已接受结构的
+# summary 条目），每个浓度完成后写一行 done 标记。--resume 时按记录逐条
+# 重放：master_rng 前进同样的次数、去重集合与计数器按记录恢复，已写出的
+# POSCAR 直接读回用于差异分析，因此续算输出与不中断运行完全一致。
+
+JOURNAL_NAME = "journal.jsonl"
+
+
+def journal_params(args, concentrations, run_seed):
+    """影响生成结果的参数；续算时必须与日志头一致。"""
+    return {
+        "input": args.input,
+        "target": args.target,
+        "concentrations": concentrations,
+        "nstruct": args.nstruct,
+        "rattle": args.rattle,
+        "min_sep": args.min_sep,
+        "min_sep_method": args.min_sep_method,
+        "max_attempts": args.max_attempts,
+        "symprec": args.symprec,
+        "overlap_hard": args.overlap_hard,
+        "overlap_warn": args.overlap_warn,
+        "repair_rounds": args.repair_rounds,
+        "seed": run_seed,
+    }
+
+
+def load_journal(path):
+    """
+    读取日志，返回 (参数头, {浓度标签: [候选记录]}, 已完成浓度标签集合)。
+    被中断时写了一半的末行会被丢弃并从文件中截掉。
+    """
+    params, events, done = None, {}, set()
+    good_bytes = 0
+    with open(path, "rb") as fh:
+        for raw in fh:
+            try:
+                rec = json.loads(raw)
+            except ValueError:
+                break
+            good_bytes += len(raw)
+            if rec["type"] == "run":
+                params = rec["params"]
+            elif rec["type"] == "cand":
+                events.setdefault(rec["label"], []).append(rec)
+            elif rec["type"] == "done":
+                done.add(rec["label"])
+    if good_bytes < path.stat().st_size:
+        with open(path, "r+b") as fh:
+            fh.truncate(good_bytes)
+    return params, events, done
+
+
+def journal_append(fh, rec):
+    """追加一条记录并立即 flush，进程被杀时已写记录不丢失。"""
+    fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    fh.flush()
 
 
 # ---------------------------------------------------------------------------
 # 单浓度生成
 # ---------------------------------------------------------------------------
 
-def generate_one_concentration(atoms, target_indices_arr, conc, args,
-                                cutoffs_by_pair, max_warn_cutoff,
-                                master_rng, outdir,
-                                spglib_mod=None):
-    """在 outdir 下生成 args.nstruct 个结构，返回该浓度的 summary dict。"""
-    n_target = len(target_indices_arr)
+def generate_one_concentration(ctx, conc, master_rng, outdir, executor=None,
+                               journal=None, label=None, replay=()):
+    """在 outdir 下生成 args.nstruct 个结构，返回该浓度的 summary dict。
+
+    executor 为 ProcessPoolExecutor 时并行构造候选结构，结果与串行一致。
+    journal 为已打开的日志文件时，每个被消费的候选以 label 记入日志；
+    replay 为该浓度此前已记录的候选，先按记录恢复状态再继续生成。
+    """
+    atoms = ctx["atoms"]
+    args = ctx["args"]
+    n_target = len(ctx["target_indices_arr"])
     n_vac = compute_n_vac(n_target, conc)  # ValueError 由 main() 统一捕获
 
     n_atoms_after = len(atoms) - n_vac
@@ -599,10 +1276,24 @@ def generate_one_concentration(atoms, target_indices_arr, conc, args,
     }
 
     seen_configs = set()
-    seen_symkeys = set()
+    seen_symkeys = {}      # 对称不变量分桶 → [(不变量, 已接受的空位集合), ...]
+    if args.symprec is not None:
+        cache_info0 = ctx["symkey_lookup"].cache_info()
     generated = 0
     n_overlap_rejected = 0
-    generated_atoms = []   # 保存已生成的 Atoms 对象，用于差异分析
+    n_overlap_repaired = 0
+    # 差异分析缓冲区：只保留空位位点与坐标，不保留 Atoms 对象
+    memmap_path = (outdir / ".diversity_positions.npy") if args.diversity_memmap else None
+    diversity_buf = new_diversity_buffer(
+        args.nstruct, n_atoms_after, atoms, ctx["target_indices_arr"], memmap_path
+    )
+
+    # POSCAR 输出：目录树或单个打包文件；目标元素在母胞中连续时，
+    # 本浓度所有结构的物种头部相同，只计算一次
+    poscar_out = PoscarBundle(outdir, args.bundle)
+    poscar_sc = symbol_count_after_removal(atoms.get_chemical_symbols(), args.target, n_vac)
+    if args.bundle is not None:
+        summary["bundle"] = poscar_out.path.name
 
     # 去重失败和 overlap 拒绝分开计数，避免互相消耗重试额度
     max_dedup_attempts   = args.nstruct * 100
@@ -612,114 +1303,208 @@ def generate_one_concentration(atoms, target_indices_arr, conc, args,
     overlap_attempts = 0
     total_attempts   = 0
 
-    while generated < args.nstruct:
-        if total_attempts >= max_total_attempts:
-            print(f"  [警告] 总尝试次数达到上限 {max_total_attempts}（"
-                  f"去重拒绝: {dedup_attempts}，overlap 拒绝: {overlap_attempts}），终止。")
-            break
-        total_attempts += 1
-        if dedup_attempts >= max_dedup_attempts:
-            print(f"  [警告] 去重尝试达到上限 {max_dedup_attempts}，"
-                  f"空位组合可能已穷尽。")
-            break
-        if overlap_attempts >= max_overlap_attempts:
-            print(f"  [警告] overlap 拒绝达到上限 {max_overlap_attempts}，"
-                  f"建议减小 --rattle 或 --overlap-hard。")
-            break
+    # 并行模式会提前从 master_rng 抽取种子：记录初始状态，
+    # 结束后恢复并只前进实际消费的种子数，保证后续浓度与串行一致
+    rng_state = master_rng.bit_generator.state
+    n_drawn = 0
 
+    # 续算：按日志重放已消费的候选，不重新计算
+    for rec in replay:
         seed = int(master_rng.integers(0, 10**9))
-        rng = np.random.default_rng(seed)
-
-        try:
-            chosen = choose_sites(
-                atoms, target_indices_arr, n_vac,
-                args.min_sep, rng, args.max_attempts
+        n_drawn += 1
+        total_attempts += 1
+        if seed != rec["seed"]:
+            raise RuntimeError(
+                f"journal 记录的种子 {rec['seed']} 与随机数流 {seed} 不一致，"
+                f"无法续算（{label}）。请删除输出目录后重新运行。"
             )
-        except RuntimeError as e:
-            # min-sep 约束无法满足：先将已生成部分的 summary 写入磁盘，再向上传播异常，
-            # 避免输出目录里有 POSCAR 但无对应 summary.json 的不完整状态。
-            summary["nstruct_generated"] = generated
-            summary["n_overlap_rejected"] = n_overlap_rejected
-            summary["error"] = str(e)
-            with open(outdir / "summary.json", "w", encoding="utf-8") as _f:
-                json.dump(summary, _f, indent=2, ensure_ascii=False)
-            raise
-
-        # 去重：相同空位组合
-        config_key = tuple(chosen)
-        if config_key in seen_configs:
+        event = rec["event"]
+        if event == "dup_config":
             dedup_attempts += 1
             continue
+        config_key = tuple(rec["chosen"])
         seen_configs.add(config_key)
-
-        # 构造空位结构（只调用一次，rattle 之前）
-        defect = remove_atoms(atoms, chosen)
-
-        # 去重：对称等价（可选，基于 rattle 前的拓扑构型）
+        if event == "dup_sym":
+            dedup_attempts += 1
+            continue
         if args.symprec is not None:
-            sym_key = get_symmetry_fingerprint(defect, args.symprec, spglib_mod)
-            if sym_key is not None and sym_key in seen_symkeys:
-                dedup_attempts += 1
-                continue
-            if sym_key is not None:
-                seen_symkeys.add(sym_key)
-
-        # rattle（rattle_atoms 内部做拷贝，不修改 defect 原对象）
-        defect = rattle_atoms(defect, args.rattle, rng)
-
-        # Overlap 检查
-        overlap_status, violations = check_overlap(
-            defect, cutoffs_by_pair, max_warn_cutoff
-        )
-        if overlap_status == 'hard':
+            invariant = vacancy_invariant(atoms, config_key, args.symprec)
+            add_invariant(seen_symkeys, invariant, config_key, args.symprec)
+        if event == "hard":
+            seen_configs.discard(config_key)
             n_overlap_rejected += 1
             overlap_attempts += 1
-            # 硬拒时移出 seen_configs，允许相同空位组合换 rattle seed 重试
-            seen_configs.discard(config_key)
             continue
+        entry = rec["entry"]
+        rattled = read(outdir.parent / entry["folder"] / "POSCAR", format="vasp")
+        if entry.get("repair_rounds"):
+            n_overlap_repaired += 1
+        summary["structures"].append(entry)
+        diversity_add(diversity_buf, rattled, entry["removed_indices"])
+        generated += 1
+    if replay:
+        print(f"  [续算] 已从 journal 恢复 {len(replay)} 个候选记录，"
+              f"已生成结构 {generated} 个")
 
-        # 写入结构
-        folder = outdir / f"struct_{generated:03d}"
-        folder.mkdir(parents=True, exist_ok=True)
-        write(folder / "POSCAR", defect, format="vasp", direct=True, vasp5=True)
+    def log_event(event, **extra):
+        if journal is not None:
+            journal_append(journal, {"type": "cand", "label": label,
+                                     "seed": seed, "event": event, **extra})
 
-        # 路径记录：统一相对于 outdir_root（outdir.parent），扫描/单一模式行为一致
-        folder_str = str(folder.relative_to(outdir.parent))
+    if executor is None:
+        candidates = serial_candidates(ctx, master_rng, n_vac)
+    else:
+        candidates = parallel_candidates(
+            executor, master_rng, n_vac, window=4 * args.workers
+        )
 
-        entry = {
-            "id": generated,
-            "folder": folder_str,
-            "seed": seed,
-            "removed_indices": chosen,
-            "overlap_status": overlap_status,
-        }
-        if violations:
-            entry["overlap_warnings"] = violations
-            print(f"  [OK/⚠] struct_{generated:03d}  "
-                  f"空位数: {len(chosen)}，软警告原子对: {len(violations)} 个")
-        else:
-            print(f"  [OK] struct_{generated:03d}  空位数: {len(chosen)}")
+    try:
+        while generated < args.nstruct:
+            if total_attempts >= max_total_attempts:
+                print(f"  [警告] 总尝试次数达到上限 {max_total_attempts}（"
+                      f"去重拒绝: {dedup_attempts}，overlap 拒绝: {overlap_attempts}），终止。")
+                break
+            total_attempts += 1
+            if dedup_attempts >= max_dedup_attempts:
+                print(f"  [警告] 去重尝试达到上限 {max_dedup_attempts}，"
+                      f"空位组合可能已穷尽。")
+                break
+            if overlap_attempts >= max_overlap_attempts:
+                print(f"  [警告] overlap 拒绝达到上限 {max_overlap_attempts}，"
+                      f"建议减小 --rattle 或 --overlap-hard。")
+                break
+
+            cand = next(candidates)
+            n_drawn += 1
+            seed = cand["seed"]
+
+            if "error" in cand:
+                # min-sep 约束无法满足：先将已生成部分的 summary 写入磁盘，再向上传播异常，
+                # 避免输出目录里有 POSCAR 但无对应 summary.json 的不完整状态。
+                summary["nstruct_generated"] = generated
+                summary["n_overlap_rejected"] = n_overlap_rejected
+                summary["error"] = cand["error"]
+                with open(outdir / "summary.json", "w", encoding="utf-8") as _f:
+                    json.dump(summary, _f, indent=2, ensure_ascii=False)
+                diversity_release(diversity_buf)
+                raise RuntimeError(cand["error"])
+            chosen = cand["chosen"]
+
+            # 去重：相同空位组合
+            config_key = tuple(chosen)
+            if config_key in seen_configs:
+                dedup_attempts += 1
+                log_event("dup_config")
+                continue
+            seen_configs.add(config_key)
+
+            # 去重：对称等价（可选，基于 rattle 前的拓扑构型）
+            # 先比较廉价不变量，仅在容差内一致时用 spglib 指纹与这些结构逐一比较
+            if args.symprec is not None:
+                invariant = candidate_invariant(ctx, cand)
+                matches = invariant_matches(seen_symkeys, invariant, args.symprec)
+                if matches:
+                    lookup = ctx["symkey_lookup"]
+                    sym_key = lookup(config_key)
+                    if sym_key is not None and any(lookup(k) == sym_key for k in matches):
+                        dedup_attempts += 1
+                        log_event("dup_sym", chosen=chosen)
+                        continue
+                add_invariant(seen_symkeys, invariant, config_key, args.symprec)
+
+            # rattle + overlap 检查
+            defect, overlap_status, violations = candidate_rattled(ctx, cand)
+            if overlap_status == 'hard':
+                n_overlap_rejected += 1
+                overlap_attempts += 1
+                # 硬拒时移出 seen_configs，允许相同空位组合换 rattle seed 重试
+                seen_configs.discard(config_key)
+                log_event("hard", chosen=chosen)
+                continue
 
-        summary["structures"].append(entry)
-        generated_atoms.append(defect)
-        generated += 1
+            # 写入结构
+            folder = outdir / f"struct_{generated:03d}"
+            poscar_out.add(f"{folder.name}/POSCAR", defect, sc=poscar_sc)
+
+            # 路径记录：统一相对于 outdir_root（outdir.parent），扫描/单一模式行为一致
+            folder_str = str(folder.relative_to(outdir.parent))
+
+            entry = {
+                "id": generated,
+                "folder": folder_str,
+                "seed": seed,
+                "removed_indices": chosen,
+                "overlap_status": overlap_status,
+            }
+            if cand["repair_rounds"]:
+                n_overlap_repaired += 1
+                entry["repair_rounds"] = cand["repair_rounds"]
+                entry["n_repaired_atoms"] = cand["n_repaired_atoms"]
+            if violations:
+                entry["overlap_warnings"] = violations
+                print(f"  [OK/⚠] struct_{generated:03d}  "
+                      f"空位数: {len(chosen)}，软警告原子对: {len(violations)} 个")
+            else:
+                print(f"  [OK] struct_{generated:03d}  空位数: {len(chosen)}")
+
+            summary["structures"].append(entry)
+            diversity_add(diversity_buf, defect, chosen)
+            generated += 1
+            # POSCAR 写出之后再记日志：若在两者之间被中断，续算会重新生成并覆盖该 POSCAR
+            log_event("accepted", chosen=chosen, entry=entry)
+    finally:
+        candidates.close()
+        poscar_out.close()
+        if executor is not None:
+            master_rng.bit_generator.state = rng_state
+            for _ in range(n_drawn):
+                master_rng.integers(0, 10**9)
 
     if n_overlap_rejected > 0:
         print(f"  [信息] 因硬截断 overlap 丢弃: {n_overlap_rejected} 次"
               f"（可减小 --rattle 或 --overlap-hard）")
+    if n_overlap_repaired > 0:
+        print(f"  [信息] 经局部修复后保留的结构: {n_overlap_repaired} 个")
+    if args.symprec is not None:
+        info = ctx["symkey_lookup"].cache_info()
+        n_spglib = info.misses - cache_info0.misses
+        n_cached = info.hits - cache_info0.hits
+        print(f"  [信息] 对称性去重: spglib 调用 {n_spglib} 次，缓存命中 {n_cached} 次")
 
     summary["nstruct_generated"] = generated
     summary["n_overlap_rejected"] = n_overlap_rejected
+    if args.repair_rounds > 0:
+        summary["n_overlap_repaired"] = n_overlap_repaired
 
     # 差异分析（生成 ≥ 2 个结构时自动执行）
-    if len(generated_atoms) >= 2:
-        diversity = compute_and_print_diversity(summary["structures"], generated_atoms)
+    if diversity_buf["n"] >= 2:
+        diversity = compute_and_print_diversity(
+            summary["structures"], diversity_buf, max_matrix=args.diversity_matrix_max
+        )
         if diversity:
             summary["diversity"] = diversity
+    diversity_release(diversity_buf)
 
     with open(outdir / "summary.json", "w", encoding="utf-8") as f:
         json.dump(summary, f, indent=2, ensure_ascii=False)
+    if journal is not None:
+        journal_append(journal, {"type": "done", "label": label})
+
+    return summary
 
+
+def skip_done_concentration(master_rng, replay, outdir, label):
+    """续算时跳过已完成的浓度：master_rng 前进同样次数，直接读回 summary.json。"""
+    for rec in replay:
+        seed = int(master_rng.integers(0, 10**9))
+        if seed != rec["seed"]:
+            raise RuntimeError(
+                f"journal 记录的种子 {rec['seed']} 与随机数流 {seed} 不一致，"
+                f"无法续算（{label}）。请删除输出目录后重新运行。"
+            )
+    with open(outdir / "summary.json", encoding="utf-8") as f:
+        summary = json.load(f)
+    print(f"  [续算] 该浓度已完成（{summary['nstruct_generated']} 个结构），跳过")
     return summary
 
 
@@ -779,16 +1564,86 @@ def main():
     print(f"每浓度结构数  : {args.nstruct}")
     print(f"overlap 硬截断: {args.overlap_hard} × r_cov")
     print(f"overlap 软警告: {args.overlap_warn} × r_cov")
+    if args.repair_rounds > 0:
+        print(f"overlap 修复  : 最多 {args.repair_rounds} 轮")
     if args.min_sep is not None:
-        print(f"空位最小间距  : {args.min_sep} Å")
+        print(f"空位最小间距  : {args.min_sep} Å  ({args.min_sep_method})")
+    if args.workers > 1:
+        print(f"并行进程数    : {args.workers}")
     if scan_mode:
         print(f"扫描浓度      : {[f'{c*100:.1f}%' for c in concentrations]}")
     print()
 
+    # min-sep 冲突图（外层一次性，所有浓度共用）
+    site_graph = None
+    if args.min_sep is not None and args.min_sep_method != "rejection":
+        site_graph = build_site_graph(atoms, target_indices_arr, args.min_sep)
+
     outdir_root = Path(args.outdir)
     outdir_root.mkdir(exist_ok=True)
 
-    master_rng = np.random.default_rng(args.seed)
+    # 断点续算日志（仅 --journal / --resume）：未指定 --seed 时也生成一个确定的
+    # 运行种子并记入日志，保证写了日志的运行都可以续算
+    journal_path = outdir_root / JOURNAL_NAME
+    run_seed = args.seed
+    replay_events, done_labels = {}, set()
+    journal = None
+    if args.resume and journal_path.exists():
+        old_params, replay_events, done_labels = load_journal(journal_path)
+        if run_seed is None and old_params is not None:
+            run_seed = old_params["seed"]
+        params = journal_params(args, concentrations, run_seed)
+        if old_params != params:
+            diff_keys = sorted(k for k in params
+                               if old_params is None or old_params.get(k) != params[k])
+            sys.exit(f"[错误] --resume 参数与 journal 记录不一致：{diff_keys}\n"
+                     f"  请使用与原运行相同的参数，或去掉 --resume 重新开始。")
+        journal = open(journal_path, "a", encoding="utf-8")
+        n_done = len(done_labels)
+        print(f"[续算] 读取 {journal_path}：已完成浓度 {n_done} 个，"
+              f"已记录候选 {sum(len(v) for v in replay_events.values())} 个\n")
+    elif args.resume or args.journal:
+        if args.resume:
+            print(f"[警告] 未找到 {journal_path}，从头开始生成。\n", file=sys.stderr)
+        elif journal_path.exists():
+            sys.exit(f"[错误] {journal_path} 已存在，拒绝覆盖。\n"
+                     f"  续算请使用 --resume；重新开始请先删除该文件或换用其它 --outdir。")
+        if run_seed is None:
+            run_seed = int(np.random.SeedSequence().entropy)
+        journal = open(journal_path, "w", encoding="utf-8")
+        journal_append(journal, {"type": "run",
+                                 "params": journal_params(args, concentrations, run_seed)})
+    elif journal_path.exists():
+        print(f"[警告] {journal_path} 来自之前的运行，本次未写日志，其记录与新输出不再对应，"
+              f"请勿用于 --resume。\n", file=sys.stderr)
+
+    master_rng = np.random.default_rng(run_seed)
+
+    # 各浓度共用的只读上下文；并行模式下随进程池初始化一次性分发给工作进程
+    cutoff_matrix = build_cutoff_matrix(cutoffs_by_pair)
+    ctx = {
+        "atoms": atoms,
+        "target_indices_arr": target_indices_arr,
+        "args": args,
+        "cutoff_matrix": cutoff_matrix,
+        "max_warn_cutoff": max_warn_cutoff,
+        # 母胞原子对骨架：overlap 检查只做掩码 + 距离 gather
+        "pair_skeleton": build_pair_skeleton(atoms, cutoff_matrix, max_warn_cutoff,
+                                             args.rattle),
+        "site_graph": site_graph,
+        # 对称指纹查询（LRU 缓存），所有浓度共用，只在主进程中调用
+        "symkey_lookup": (make_symkey_lookup(atoms, args.symprec, spglib_mod)
+                          if args.symprec is not None else None),
+    }
+    executor = None
+    if args.workers > 1:
+        # 闭包不可 pickle，且工作进程只计算对称不变量，不需要 spglib
+        worker_ctx = dict(ctx, symkey_lookup=None)
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(worker_ctx,),
+        )
 
     if scan_mode:
         scan_summary = {
@@ -811,12 +1666,14 @@ def main():
 
             conc_outdir = outdir_root / label if scan_mode else outdir_root
 
-            summary = generate_one_concentration(
-                atoms, target_indices_arr, conc, args,
-                cutoffs_by_pair, max_warn_cutoff,
-                master_rng, conc_outdir,
-                spglib_mod=spglib_mod,
-            )
+            replay = replay_events.get(label, [])
+            if label in done_labels and (conc_outdir / "summary.json").exists():
+                summary = skip_done_concentration(master_rng, replay, conc_outdir, label)
+            else:
+                summary = generate_one_concentration(
+                    ctx, conc, master_rng, conc_outdir, executor=executor,
+                    journal=journal, label=label, replay=replay,
+                )
 
             if scan_mode:
                 scan_summary["concentrations"].append({
@@ -832,6 +1689,11 @@ def main():
 
     except (ValueError, RuntimeError) as e:
         sys.exit(f"[错误] {e}")
+    finally:
+        if journal is not None:
+            journal.close()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
 
     if scan_mode:
         scan_summary_path = outdir_root / "scan_summary.json"
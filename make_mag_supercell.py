@@ -32,9 +32,11 @@ make_supercell.py
 import argparse
 import sys
 import numpy as np
-from ase.io import read, write
+from ase.io import read
 from ase.build import make_supercell
 
+from poscar_writer import write_poscar
+
 
 # ══════════════════════════════════════════════
 # 核心函数
@@ -244,7 +246,7 @@ def main():
         print("         请用 --magmom '4 -4 0 0 0 0 0 0 0' 指定原胞磁矩。\n")
         # 仍然写出结构，只是没有 MAGMOM
         if args.export:
-            write(args.outfile, super_atoms, format="vasp", direct=True)
+            write_poscar(args.outfile, super_atoms)
             print(f"已写出超胞结构（无 MAGMOM）→ {args.outfile}")
         sys.exit(0)
 
@@ -278,7 +280,7 @@ def main():
 
     # ── 写出结构 ──
     if args.export:
-        write(args.outfile, super_atoms, format="vasp", direct=True)
+        write_poscar(args.outfile, super_atoms)
         print(f"已写出超胞结构 → {args.outfile}")
 
 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+poscar_writer.py
+----------------
+结构生成脚本（gen_amorphous.py / vacancy_generator.py / make_mag_supercell.py）
+共用的快速 POSCAR 写出工具。
+
+输出格式与 ase.io.write(..., format="vasp", direct=True) 逐字节一致
+（物种/计数按连续段分组、1.0 缩放因子、%21.16f 晶格、%19.16f 坐标），
+但坐标整块用一次 % 格式化生成，不经过 ASE 的逐原子写出流程。
+
+批量写出时可选择打包成单个 tar / zip 文件，成员名与目录模式下的相对路径一致
+（如 struct_000/POSCAR），避免在文件系统上产生成千上万个小目录：
+
+    with PoscarBundle(outdir, "tar") as bundle:
+        for name, atoms in structures:
+            bundle.add(f"{name}/POSCAR", atoms)
+
+    tar -xf structures.tar   # 需要时再解包
+
+含约束（Selective dynamics）或速度的结构退回 ase.io.write，保持原有语义。
+
+依赖：
+    pip install ase numpy
+"""
+
+import io
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+
+BUNDLE_FORMATS = ("tar", "zip")
+# 打包成员的固定时间戳（zip 能表示的最早时刻 1980-01-01），保证同种子运行的包可复现
+BUNDLE_MTIME = 315532800
+
+
+def symbol_count(symbols):
+    """连续相同元素合并为 [(元素, 个数), ...]，与 ASE vasp 写出器的分组一致。"""
+    symbols = np.asarray(symbols)
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+    counts = np.diff(np.r_[starts, len(symbols)])
+    return [(str(symbols[s]), int(c)) for s, c in zip(starts, counts)]
+
+
+def symbol_count_after_removal(symbols, element, n_removed):
+    """
+    从 symbols 中删去任意 n_removed 个 element 原子后的物种分组（symbol_count 格式）。
+    element 在 symbols 中为单个连续段且删后仍有剩余时，结果与删去哪些原子无关，
+    可作为同一批结构共享的 sc；否则返回 None（由 poscar_text 逐个结构分组）。
+    """
+    sc = symbol_count(symbols)
+    runs = [k for k, (s, _) in enumerate(sc) if s == element]
+    if len(runs) != 1 or sc[runs[0]][1] <= n_removed:
+        return None
+    k = runs[0]
+    sc[k] = (element, sc[k][1] - n_removed)
+    return sc
+
+
+def format_poscar(cell, sc, coords, direct=True):
+    """
+    由晶格、物种分组和坐标数组格式化出完整的 POSCAR 文本。
+
+    cell   : (3, 3) 晶格矢量（行向量，Å）
+    sc     : symbol_count() 的结果，可在同一批结构间共享
+    coords : (N, 3) 分数坐标（direct=True）或笛卡尔坐标（Å）
+    """
+    coords = np.asarray(coords, dtype=float)
+    lines = [
+        " ".join(f"{s:2s}" for s, _ in sc) + "\n",
+        f"{1.0:19.16f}\n",
+    ]
+    for vec in np.asarray(cell, dtype=float):
+        lines.append("  " + " ".join(f"{el:21.16f}" for el in vec) + "\n")
+    lines.append(" " + " ".join(f"{s:3s}" for s, _ in sc) + "\n ")
+    lines.append(" ".join(f"{c:3d}" for _, c in sc) + "\n")
+    lines.append("Direct\n" if direct else "Cartesian\n")
+    lines.append((" %19.16f %19.16f %19.16f\n" * len(coords)) % tuple(coords.ravel()))
+    return "".join(lines)
+
+
+def _needs_ase(atoms):
+    return bool(atoms.constraints) or atoms.has("momenta")
+
+
+def poscar_text(atoms, direct=True, sc=None):
+    """返回 atoms 的 POSCAR 文本；sc 可传入预先算好的物种分组。"""
+    if _needs_ase(atoms):
+        from ase.io import write
+        buf = io.StringIO()
+        write(buf, atoms, format="vasp", direct=direct)
+        return buf.getvalue()
+    if sc is None:
+        sc = symbol_count(atoms.get_chemical_symbols())
+    cell = atoms.cell[:]
+    if direct:
+        # 与 ASE get_scaled_positions(wrap=False) 相同的求解方式，保证逐字节一致
+        coords = np.linalg.solve(atoms.cell.complete().T, atoms.positions.T).T
+    else:
+        coords = atoms.positions
+    return format_poscar(cell, sc, coords, direct=direct)
+
+
+def write_poscar(path, atoms, direct=True, sc=None):
+    """写出单个 POSCAR，可替代 ase.io.write(path, atoms, format="vasp", direct=...)。"""
+    Path(path).write_text(poscar_text(atoms, direct=direct, sc=sc))
+
+
+class PoscarBundle:
+    """
+    逐个追加 POSCAR 的输出目标：目录树，或 outdir/structures.{tar,zip} 单个打包文件。
+    成员名即目录模式下相对 outdir 的路径。同一批结构物种分组相同时，可给出
+    共享的 sc（见 symbol_count_after_removal），头部不再逐个结构重建。
+    打包文件的成员时间戳固定，相同输入得到逐字节相同的包。
+    """
+
+    def __init__(self, outdir, fmt=None):
+        if fmt is not None and fmt not in BUNDLE_FORMATS:
+            raise ValueError(f"不支持的打包格式 '{fmt}'，可选：{BUNDLE_FORMATS}")
+        self.outdir = Path(outdir)
+        self.outdir.mkdir(parents=True, exist_ok=True)
+        self.fmt = fmt
+        self.path = self.outdir / f"structures.{fmt}" if fmt else self.outdir
+        self._fh = None
+        if fmt == "tar":
+            self._fh = tarfile.open(self.path, "w")
+        elif fmt == "zip":
+            self._fh = zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, name, atoms, direct=True, sc=None):
+        """追加一个结构；sc 为共享的物种分组（None 时按 atoms 计算）。"""
+        text = poscar_text(atoms, direct=direct, sc=sc)
+        if self.fmt is None:
+            dest = self.outdir / name
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.write_text(text)
+        elif self.fmt == "tar":
+            data = text.encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = BUNDLE_MTIME
+            self._fh.addfile(info, io.BytesIO(data))
+        else:
+            info = zipfile.ZipInfo(name, date_time=time.gmtime(BUNDLE_MTIME)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self._fh.writestr(info, text)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
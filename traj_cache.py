@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+traj_cache.py
+-------------
+多帧 XYZ 轨迹的二进制缓存，供 bond_length_traj.py / xyz_extractor.py 共用。
+
+同一条轨迹反复分析（调 --rmax / --scale）时，每次都要重新解析整个文本 XYZ。
+首次读取时把轨迹转存为缓存目录 <轨迹名>.cache/：
+
+    meta.json       源文件路径、大小、mtime（缓存键）及帧数、原子数、dtype
+    positions.npy   (帧数, 原子数, 3) 连续坐标数组（float64 或 float32）
+    numbers.npy     (原子数,) 原子序数（要求各帧原子种类与顺序相同）
+    cells.npy       (帧数, 3, 3) 逐帧晶胞（XYZ 无晶胞时为 0）
+    pbc.npy         (帧数, 3) 逐帧周期性
+    offsets.npy     (帧数,) 每帧首行在源文件中的字节偏移
+
+之后的运行以 np.load(mmap_mode="r") 内存映射打开，不再解析文本，按需取帧。
+源文件路径、大小或 mtime 任一变化即视为过期并重建。
+
+只缓存元素与坐标（以及晶胞），extxyz 中的其它逐原子属性（力、速度等）不保留。
+
+依赖：
+    pip install ase numpy
+"""
+
+import json
+import os
+import shutil
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+
+CACHE_VERSION = 1
+CACHE_DTYPES = ("float64", "float32")
+
+
+def cache_dir(xyz_path):
+    """轨迹对应的缓存目录：与轨迹同目录的 <文件名>.cache/。"""
+    xyz_path = Path(xyz_path)
+    return xyz_path.with_name(xyz_path.name + ".cache")
+
+
+def _source_key(xyz_path):
+    st = Path(xyz_path).stat()
+    return {"source": str(Path(xyz_path).resolve()), "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns}
+
+
+def open_cache(xyz_path, dtype=None):
+    """
+    打开有效的缓存，返回 dict（positions 等为内存映射数组）；
+    缓存不存在、已过期或 dtype 不符（dtype 为 None 时不检查）时返回 None。
+    """
+    root = cache_dir(xyz_path)
+    try:
+        meta = json.loads((root / "meta.json").read_text())
+    except (OSError, ValueError):
+        return None
+    key = _source_key(xyz_path)
+    if meta.get("version") != CACHE_VERSION or any(meta.get(k) != v for k, v in key.items()):
+        return None
+    if dtype is not None and meta["dtype"] != dtype:
+        return None
+    try:
+        cache = {name: np.load(root / f"{name}.npy", mmap_mode="r")
+                 for name in ("positions", "numbers", "cells", "pbc", "offsets")}
+    except (OSError, ValueError):
+        return None
+    cache["meta"] = meta
+    return cache
+
+
+def build_cache(xyz_path, dtype="float64"):
+    """
+    解析一遍文本 XYZ 并写出缓存（先写入临时目录再改名，中断不会留下半个缓存），
+    返回 open_cache 的结果。各帧原子数、种类或顺序不一致，或文本无法按帧索引时抛出 ValueError。
+    """
+    from ase.io import iread
+    from xyz_extractor import build_frame_index
+
+    if dtype not in CACHE_DTYPES:
+        raise ValueError(f"不支持的缓存 dtype '{dtype}'，可选：{CACHE_DTYPES}")
+    xyz_path = Path(xyz_path)
+    key = _source_key(xyz_path)
+    try:
+        offsets, n_atoms = build_frame_index(xyz_path)
+    except ValueError as e:
+        raise ValueError(f"无法索引轨迹（{e}），无法缓存") from None
+    n_frames = len(offsets)
+
+    root = cache_dir(xyz_path)
+    tmp = root.with_name(f"{root.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    try:
+        positions = np.lib.format.open_memmap(tmp / "positions.npy", mode="w+",
+                                              dtype=dtype, shape=(n_frames, n_atoms, 3))
+        cells = np.zeros((n_frames, 3, 3))
+        pbc = np.zeros((n_frames, 3), dtype=bool)
+        numbers = None
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for k, atoms in enumerate(iread(str(xyz_path), index=":", format="extxyz")):
+                if numbers is None:
+                    numbers = atoms.numbers.copy()
+                elif not np.array_equal(atoms.numbers, numbers):
+                    raise ValueError(f"第 {k} 帧的原子种类/顺序与首帧不同，无法缓存")
+                positions[k] = atoms.positions
+                cells[k] = atoms.cell[:]
+                pbc[k] = atoms.pbc
+        positions.flush()
+        del positions
+        np.save(tmp / "numbers.npy", numbers)
+        np.save(tmp / "cells.npy", cells)
+        np.save(tmp / "pbc.npy", pbc)
+        np.save(tmp / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+        meta = dict(key, version=CACHE_VERSION, dtype=dtype,
+                    n_frames=n_frames, n_atoms=n_atoms)
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2))
+        shutil.rmtree(root, ignore_errors=True)
+        tmp.rename(root)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return open_cache(xyz_path, dtype)
+
+
+def load_cache(xyz_path, dtype="float64"):
+    """有效缓存直接打开，否则重建。返回 (cache, 是否新建)。"""
+    cache = open_cache(xyz_path, dtype)
+    if cache is not None:
+        return cache, False
+    return build_cache(xyz_path, dtype), True
+
+
+def cached_atoms(cache, k):
+    """缓存中第 k 帧的 Atoms（只复制这一帧的坐标）。"""
+    from ase import Atoms
+
+    return Atoms(numbers=cache["numbers"], positions=cache["positions"][k],
+                 cell=cache["cells"][k], pbc=cache["pbc"][k])
+
+
+def iter_cached_atoms(cache, start=0, stop=None):
+    """逐帧产出 [start, stop) 的 Atoms。"""
+    stop = len(cache["offsets"]) if stop is None else stop
+    for k in range(start, stop):
+        yield cached_atoms(cache, k)
+
+
+def cached_frame_index(xyz_path):
+    """有效缓存中的 (帧字节偏移列表, 原子数)，与 xyz_extractor.build_frame_index 相同；无缓存时为 None。"""
+    cache = open_cache(xyz_path)
+    if cache is None:
+        return None
+    return cache["offsets"].tolist(), int(cache["meta"]["n_atoms"])
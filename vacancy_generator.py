@@ -11,21 +11,29 @@ vacancy_generator.py
     python vacancy_generator.py --sub Fe                # O→Fe 置换
     python vacancy_generator.py --nvac 2 --export       # 枚举并写出文件
     python vacancy_generator.py --nvac 2 --export --interactive  # 交互式完整流程
+    python vacancy_generator.py --nvac 2 --export -i -j 16 --max-vaspkit 8  # 并行导出
+    python vacancy_generator.py --nvac 2 --export --potcar-dir ~/potpaw_PBE --potcar-map Sr=Sr_sv
 
 依赖：
     pip install spglib ase
 """
 
 import argparse
+import hashlib
+import json
 import os
 import shutil
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 import spglib
-from ase.io import read, write
+from ase.io import read
+
+from poscar_writer import symbol_count, write_poscar
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -75,73 +83,215 @@ def find_inequiv(atoms, element, symprec):
     return result, ds
 
 
-def remove_atom(atoms, global_idx):
-    """删除指定全局索引的原子，返回新 Atoms 对象。"""
-    mask = [i for i in range(len(atoms)) if i != global_idx]
+def remove_atoms(atoms, indices):
+    """一次删除多个全局索引的原子，返回新 Atoms 对象。"""
+    mask = np.ones(len(atoms), dtype=bool)
+    mask[list(indices)] = False
     return atoms[mask]
 
 
-def substitute_atom(atoms, global_idx, new_element):
-    """将指定索引的原子替换为 new_element，保持位置不变。"""
+def substitute_atoms(atoms, indices, new_element):
+    """将多个索引的原子替换为 new_element，保持位置不变。"""
     new_atoms = atoms.copy()
     syms = list(new_atoms.get_chemical_symbols())
-    syms[global_idx] = new_element
+    for idx in indices:
+        syms[idx] = new_element
     new_atoms.set_chemical_symbols(syms)
     return new_atoms
 
 
+def remove_atom(atoms, global_idx):
+    """删除指定全局索引的原子，返回新 Atoms 对象。"""
+    return remove_atoms(atoms, [global_idx])
+
+
+def substitute_atom(atoms, global_idx, new_element):
+    """将指定索引的原子替换为 new_element，保持位置不变。"""
+    return substitute_atoms(atoms, [global_idx], new_element)
+
+
 # ══════════════════════════════════════════════════════════════════════════════
-# 多缺陷核心：递归枚举（vacancy 或 substitution）
+# 多缺陷核心：母结构对称群在目标子晶格上的轨道枚举（vacancy 或 substitution）
 # ══════════════════════════════════════════════════════════════════════════════
+#
+# 只对母结构调用一次 spglib：把每个对称操作作用到目标元素的位点上，得到子晶格上的
+# 置换表示 perms（n_ops × n_sites）。两个 k 缺陷组合等价 ⇔ 存在 g 使 g(S) = S'，
+# 于是不等价组合 = k 子集在该置换群下的轨道。
+#
+# 每个轨道取"排序后字典序最小"的子集作为规范代表，按有序生成（orderly generation）
+# 逐层扩展：规范子集去掉最大元素后仍是规范的，因此只需在规范的 (k-1) 子集后追加
+# 更大的位点，并检查新子集在所有操作下的像是否都不小于自身。中间结构不再调用 spglib。
+
+def site_permutations(atoms, ds, indices, symprec):
+    """
+    母结构对称操作在目标位点 indices 上的置换表示。
+    返回 (n_perm, n_sites) 整数数组：perm[g, a] = b 表示操作 g 把第 a 个目标位点
+    映射到第 b 个（均为 indices 中的序号）；相同的置换只保留一份。
+    """
+    frac = atoms.get_scaled_positions()[indices]
+    cell = atoms.get_cell()[:]
+    n = len(indices)
+    perms = []
+    for rot, trans in zip(ds.rotations, ds.translations):
+        image = frac @ rot.T + trans
+        diff = image[:, None, :] - frac[None, :, :]
+        diff -= np.round(diff)
+        dist = np.linalg.norm(diff @ cell, axis=-1)
+        perm = dist.argmin(axis=1)
+        if (dist[np.arange(n), perm].max() > 2 * symprec
+                or len(np.unique(perm)) != n):
+            raise RuntimeError(
+                f"对称操作无法映射到目标位点（symprec={symprec}），请调整 --symprec。"
+            )
+        perms.append(perm)
+    return np.unique(np.array(perms), axis=0)
+
 
-def enumerate_multi_defect(atoms, element, symprec, nvac, sub_element=None,
-                           _depth=0, _prefix=()):
+def _image_order(perms, subsets):
     """
-    递归枚举 nvac 个不等价缺陷组合。
+    各子集在所有操作下的像（排序后）与自身逐字典序比较。
+    返回 (smaller, equal)，形状均为 (n_perm, n_subsets)。
+    """
+    images = np.sort(perms[:, subsets], axis=-1)
+    diff = images - subsets[None]
+    nonzero = diff != 0
+    first = nonzero.argmax(axis=-1)
+    lead = np.take_along_axis(diff, first[..., None], axis=-1)[..., 0]
+    equal = ~nonzero.any(axis=-1)
+    return (~equal) & (lead < 0), equal
+
+
+def enumerate_canonical_subsets(perms, k):
+    """
+    有序生成 k 子集在置换群 perms 下的全部规范代表（像的字典序最小者）。
+    返回 (reps, multiplicity)：reps 为 (n_orbit, k) 位点序号数组（行内升序），
+    multiplicity 为各轨道大小（等价组合数 = 群阶 / 稳定子阶）。
+    """
+    n = perms.shape[1]
+    level = np.empty((1, 0), dtype=np.int64)
+    for depth in range(k):
+        blocks = []
+        for prefix in level:
+            start = prefix[-1] + 1 if depth else 0
+            ext = np.arange(start, n - (k - depth - 1))
+            if ext.size == 0:
+                continue
+            cand = np.hstack([np.broadcast_to(prefix, (ext.size, depth)), ext[:, None]])
+            smaller, _ = _image_order(perms, cand)
+            blocks.append(cand[~smaller.any(axis=0)])
+        level = np.concatenate(blocks) if blocks else np.empty((0, depth + 1), dtype=np.int64)
+    if len(level) == 0:
+        return level, np.empty(0, dtype=np.int64)
+    _, equal = _image_order(perms, level)
+    return level, len(perms) // equal.sum(axis=0)
+
+
+def stepwise_site_numbers(perms, subset):
+    """
+    与逐个引入缺陷的描述一致的位点编号：第 j 个缺陷的编号是它在"前 j 个缺陷的
+    逐点稳定子群"下所在轨道的序号（按轨道中最小位点排序，已占据的位点不计）。
+    第一个编号即母结构中的不等价位点序号。
+    """
+    group = perms
+    numbers = []
+    for j, a in enumerate(subset):
+        orbit_min = group.min(axis=0)           # 子群中每个位点所在轨道的最小位点
+        remaining = np.setdiff1d(np.arange(perms.shape[1]), subset[:j])
+        numbers.append(int(np.searchsorted(np.unique(orbit_min[remaining]), orbit_min[a])) + 1)
+        group = group[group[:, a] == a]
+    return numbers
+
+
+def defect_site_group(atoms, element, symprec):
+    """
+    母结构中 element 子晶格的对称信息（只调用一次 spglib）：
+    {"sites": find_inequiv 结果, "ds": dataset, "targets": 目标原子全局索引,
+     "perms": site_permutations 置换表示}；结构中没有 element 时返回 None。
+    """
+    sites, ds = find_inequiv(atoms, element, symprec)
+    if not sites:
+        return None
+    targets = np.array([i for i, s in enumerate(atoms.get_chemical_symbols()) if s == element])
+    return {"sites": sites, "ds": ds, "targets": targets,
+            "perms": site_permutations(atoms, ds, targets, symprec)}
+
+
+def stepwise_wyckoffs(atoms, chosen, symprec, ds, sub_element=None, cache=None):
+    """
+    逐个引入缺陷时每一步所选位点的 Wyckoff 字母：第 j 个缺陷取"已引入前 j 个缺陷"的
+    中间结构中的字母（第一个取母结构 ds），与 stepwise_site_numbers 的编号对应。
+    中间结构的 spglib 结果按已引入缺陷的前缀缓存在 cache 中，各组合共用；
+    spglib 无法识别中间结构时该步记为 "?"。
+    """
+    cache = {} if cache is None else cache
+    letters = [ds.wyckoffs[chosen[0]]]
+    for j in range(1, len(chosen)):
+        prefix = tuple(chosen[:j])
+        if prefix not in cache:
+            if sub_element is None:
+                inter = remove_atoms(atoms, prefix)
+            else:
+                inter = substitute_atoms(atoms, prefix, sub_element)
+            try:
+                cache[prefix] = get_dataset(inter, symprec).wyckoffs
+            except RuntimeError:
+                cache[prefix] = None
+        wyckoffs, a = cache[prefix], chosen[j]
+        if wyckoffs is None:
+            letters.append("?")
+            continue
+        # 空位模式下中间结构删去了前缀原子，索引需前移
+        idx = a if sub_element is not None else a - sum(1 for p in prefix if p < a)
+        letters.append(wyckoffs[idx])
+    return letters
+
+
+def enumerate_multi_defect(atoms, element, symprec, nvac, sub_element=None, group=None):
+    """
+    枚举 nvac 个不等价缺陷组合（母结构对称群下的轨道代表）。
 
     sub_element=None  → vacancy（删除原子）
     sub_element='Fe'  → substitution（原子替换）
 
     Returns list of dict:
-        label        : 位点标签，如 "site1(e)+site2(f)"
-        atoms_final  : 含 nvac 个缺陷的 Atoms
-        wyckoffs     : 每步 Wyckoff 字母列表
-        defect_indices_frac : 每步缺陷位置（分数坐标，用于后续微扰）
+        label          : 位点标签，如 "site1(c)+site2(s)"（编号见 stepwise_site_numbers，
+                         字母见 stepwise_wyckoffs）
+        atoms_final    : 含 nvac 个缺陷的 Atoms
+        wyckoffs       : 每步 Wyckoff 字母列表
+        defect_frac    : 每个缺陷位置（分数坐标，用于后续微扰）
+        defect_indices : 缺陷在母结构中的全局索引
+        multiplicity   : 与该组合等价的组合数（轨道大小）
+
+    group 可传入预先算好的 defect_site_group 结果。
     """
-    if nvac == 0:
-        return [{"label": "", "atoms_final": atoms,
-                 "wyckoffs": [], "defect_frac": []}]
-
-    sites, _ = find_inequiv(atoms, element, symprec)
-    if not sites:
+    if group is None:
+        group = defect_site_group(atoms, element, symprec)
+    if group is None:
         return []
 
-    results = []
-    for i, site in enumerate(sites):
-        del_idx   = site["representative"]
-        frac_pos  = atoms.get_scaled_positions()[del_idx].copy()
+    ds, targets, perms = group["ds"], group["targets"], group["perms"]
+    reps, multiplicity = enumerate_canonical_subsets(perms, nvac)
 
+    frac = atoms.get_scaled_positions()
+    prefix_wyckoffs = {}
+    results = []
+    for subset, mult in zip(reps, multiplicity):
+        chosen = [int(i) for i in targets[subset]]
         if sub_element is None:
-            new_atoms = remove_atom(atoms, del_idx)
-            # 置换后递归时索引会偏移，vacancy 需要修正
-            sub = enumerate_multi_defect(
-                new_atoms, element, symprec, nvac - 1, sub_element,
-                _depth + 1, _prefix + (del_idx,)
-            )
+            final = remove_atoms(atoms, chosen)
         else:
-            new_atoms = substitute_atom(atoms, del_idx, sub_element)
-            sub = enumerate_multi_defect(
-                new_atoms, element, symprec, nvac - 1, sub_element,
-                _depth + 1, _prefix + (del_idx,)
-            )
-
-        for s in sub:
-            depth_label = f"site{i+1}({site['wyckoff']})"
-            s["label"]   = depth_label + ("+" + s["label"] if s["label"] else "")
-            s["wyckoffs"] = [site["wyckoff"]] + s["wyckoffs"]
-            s["defect_frac"] = [frac_pos] + s["defect_frac"]
-            results.append(s)
-
+            final = substitute_atoms(atoms, chosen, sub_element)
+        letters = stepwise_wyckoffs(atoms, chosen, symprec, ds, sub_element, prefix_wyckoffs)
+        results.append({
+            "label"         : "+".join(
+                f"site{n}({w})"
+                for n, w in zip(stepwise_site_numbers(perms, subset), letters)),
+            "atoms_final"   : final,
+            "wyckoffs"      : letters,
+            "defect_frac"   : [frac[i].copy() for i in chosen],
+            "defect_indices": chosen,
+            "multiplicity"  : int(mult),
+        })
     return results
 
 
@@ -149,29 +299,31 @@ def enumerate_multi_defect(atoms, element, symprec, nvac, sub_element=None,
 # 去重
 # ══════════════════════════════════════════════════════════════════════════════
 
-def structure_key(atoms, symprec):
+def canonical_form(perms, subset):
+    """缺陷位点集合（目标位点序号）在所有对称操作下的像中，排序后字典序最小者。"""
+    images = np.sort(perms[:, subset], axis=1)
+    return images[np.lexsort(images.T[::-1])[0]]
+
+
+def canonical_key(perms, subset):
+    """canonical_form 的 64 位哈希；等价的缺陷组合得到相同的键。O(|G|·k)。"""
+    canon = np.ascontiguousarray(canonical_form(perms, subset), dtype=np.int64)
+    return int.from_bytes(hashlib.blake2b(canon.tobytes(), digest_size=8).digest(), "little")
+
+
+def deduplicate(candidates, group):
     """
-    (空间群编号, 元素符号列表排序, 所有原子分数坐标排序) 作为哈希键。
+    按母结构对称群去重：对每个候选的缺陷索引集合取规范形式并哈希，
+    不再对叶结构调用 spglib。64 位键相同但规范形式不同（哈希碰撞）时仍视为不同结构。
     """
-    try:
-        ds  = get_dataset(atoms, symprec)
-        sgn = ds.number
-    except RuntimeError:
-        sgn = -1
-    syms_coords = tuple(sorted(
-        (sym, tuple(np.round(fc % 1.0, 4)))
-        for sym, fc in zip(atoms.get_chemical_symbols(),
-                           atoms.get_scaled_positions())
-    ))
-    return (sgn, syms_coords)
-
-
-def deduplicate(candidates, symprec):
+    targets, perms = group["targets"], group["perms"]
     seen, unique = {}, []
     for cand in candidates:
-        key = structure_key(cand["atoms_final"], symprec)
-        if key not in seen:
-            seen[key] = True
+        subset = np.searchsorted(targets, cand["defect_indices"])
+        canon = canonical_form(perms, subset)
+        forms = seen.setdefault(canonical_key(perms, subset), [])
+        if not any(np.array_equal(canon, f) for f in forms):
+            forms.append(canon)
             unique.append(cand)
     return unique
 
@@ -196,27 +348,18 @@ def apply_perturbation(atoms, defect_frac_list, amplitude=0.05,
     """
     rng       = np.random.default_rng(seed)
     new_atoms = atoms.copy()
-    cell      = atoms.get_cell()
+    cell      = atoms.get_cell()[:]
     cart_pos  = atoms.get_positions()
     n_atoms   = len(atoms)
 
-    # 将缺陷分数坐标转为 Cartesian
-    defect_carts = [cell.T @ frac for frac in defect_frac_list]
-
-    perturbed_mask = np.zeros(n_atoms, dtype=bool)
-
-    for d_cart in defect_carts:
-        for i in range(n_atoms):
-            # 最小镜像距离
-            diff = cart_pos[i] - d_cart
-            # 粗略 MIC（单胞尺度合理）
-            frac_diff = np.linalg.solve(cell.T, diff)
-            frac_diff -= np.round(frac_diff)
-            mic_dist  = np.linalg.norm(cell.T @ frac_diff)
-            if mic_dist < radius:
-                perturbed_mask[i] = True
+    # 所有（缺陷, 原子）对的最小镜像距离一次算出：晶胞只求逆一次，分数坐标差取整折回
+    defect_frac = np.asarray(defect_frac_list, dtype=float).reshape(-1, 3)
+    frac_diff = (cart_pos[None, :, :] - (defect_frac @ cell)[:, None, :]) @ np.linalg.inv(cell)
+    frac_diff -= np.round(frac_diff)
+    mic_dist = np.linalg.norm(frac_diff @ cell, axis=-1)       # (n_defect, n_atoms)
+    perturbed_mask = (mic_dist < radius).any(axis=0)
 
-    # 对受影响原子施加各向同性随机位移
+    # 对受影响原子施加各向同性随机位移（仍为全部原子抽样，保证同一种子结果不变）
     displacements = rng.uniform(-amplitude, amplitude, (n_atoms, 3))
     displacements[~perturbed_mask] = 0.0
     new_atoms.set_positions(cart_pos + displacements)
@@ -253,15 +396,16 @@ def print_multi_summary(unique, nvac, element, symprec, sub_element=None):
     print(f"  不等价 {nvac} {element} {mode}组合（去重后）")
     print("=" * 70)
     print(f"  共 {len(unique)} 种不等价组合\n")
-    print(f"  {'#':>4}  {'组合标签':<42}  {'最终空间群'}")
-    print("  " + "-" * 75)
+    print(f"  {'#':>4}  {'组合标签':<42}  {'简并度':>6}  {'最终空间群'}")
+    print("  " + "-" * 83)
     for i, cand in enumerate(unique):
         try:
             ds = get_dataset(cand["atoms_final"], symprec)
             sg = f"{ds.international} (No.{ds.number})"
         except Exception:
             sg = "未知"
-        print(f"  {i+1:>4}  {cand['label']:<42}  {sg}")
+        mult = cand.get("multiplicity", "-")
+        print(f"  {i+1:>4}  {cand['label']:<42}  {mult:>6}  {sg}")
     print()
 
 
@@ -289,7 +433,7 @@ def ask_str(prompt, default=None):
     return ans if ans else default
 
 
-def interactive_setup():
+def interactive_setup(potcar_dir=None):
     """
     交互式询问：
       - 是否复制 INCAR / KPOINTS / 运行脚本
@@ -313,7 +457,10 @@ def interactive_setup():
         cfg["runscript"]= ask_str("运行脚本路径（空=跳过）", "")
 
     # ── POTCAR ──
-    cfg["gen_potcar"] = ask_yes_no("用 vaspkit 自动生成 POTCAR（在每个缺陷目录内运行）？")
+    cfg["gen_potcar"] = ask_yes_no("自动生成 POTCAR？")
+    if cfg["gen_potcar"]:
+        cfg["potcar_dir"] = ask_str("POTCAR 库目录（空=在每个缺陷目录内运行 vaspkit）",
+                                    potcar_dir)
 
     # ── 微扰 ──
     cfg["perturb"] = ask_yes_no("对缺陷邻域添加随机微扰（打破对称性）？")
@@ -341,6 +488,7 @@ def generate_potcar(workdir):
     在 workdir 内运行 `echo -e "103\n" | vaspkit` 生成 POTCAR。
     vaspkit 会读取当前目录的 POSCAR 自动判断元素顺序，因此必须在
     POSCAR 已写出之后、进入该目录再调用。
+    返回 (是否成功, 说明)，不直接打印（由导出流水线汇总）。
     """
     cmd = 'echo -e "103\n" | vaspkit'
     try:
@@ -348,88 +496,250 @@ def generate_potcar(workdir):
             cmd, shell=True, cwd=str(workdir),
             capture_output=True, text=True, timeout=60
         )
-        potcar_path = Path(workdir) / "POTCAR"
-        if potcar_path.exists():
-            print(f"  [POTCAR] vaspkit 生成成功 → {workdir.name}/POTCAR")
-        else:
-            print(f"  [警告] vaspkit 未生成 POTCAR（检查 vaspkit 配置）")
-            if result.stdout:
-                print(f"    stdout: {result.stdout.strip()[:200]}")
-            if result.stderr:
-                print(f"    stderr: {result.stderr.strip()[:200]}")
     except subprocess.TimeoutExpired:
-        print(f"  [错误] vaspkit 超时（workdir: {workdir}）")
+        return False, "vaspkit 超时"
     except FileNotFoundError:
-        print("  [错误] 找不到 vaspkit，请确认已加载对应模块或在 PATH 中")
+        return False, "找不到 vaspkit，请确认已加载对应模块或在 PATH 中"
+    if (Path(workdir) / "POTCAR").exists():
+        return True, "vaspkit 生成成功"
+    detail = "; ".join(f"{name}: {text.strip()[:200]}"
+                       for name, text in (("stdout", result.stdout), ("stderr", result.stderr))
+                       if text and text.strip())
+    return False, "vaspkit 未生成 POTCAR（检查 vaspkit 配置）" + (f"  {detail}" if detail else "")
+
+
+def parse_potcar_map(tokens):
+    """--potcar-map Sr=Sr_sv Ti=Ti_sv → {"Sr": "Sr_sv", "Ti": "Ti_sv"}。"""
+    mapping = {}
+    for t in tokens or []:
+        el, sep, label = t.partition("=")
+        if not sep or not el or not label:
+            raise ValueError(f"无法解析 --potcar-map 项 '{t}'（格式：元素=赝势目录名）")
+        mapping[el] = label
+    return mapping
+
+
+class PotcarLibrary:
+    """
+    本地 POTCAR 拼接缓存，替代逐目录运行 vaspkit。
+
+    库目录为 potpaw 布局：<potcar_dir>/<赝势名>/POTCAR，赝势名默认同元素名，
+    可用 mapping（--potcar-map）改为 Sr_sv 等。按 POSCAR 的物种分组顺序拼接，
+    拼好的字节按内容寻址缓存到 <cache_dir>/POTCAR_<赝势名>_<内容哈希>，各目录优先硬链接，
+    跨文件系统等情况退回复制。缓存文件只经临时文件 + os.replace 整体替换，
+    从不原地改写，已链接到各目录（可能正被作业读取）的 POTCAR 不受后续运行影响。导出时子结构已按统一的物种顺序分组
+    （group_by_species），物种集合相同的子结构共用一次拼接。线程安全。
+    """
 
+    def __init__(self, potcar_dir, cache_dir, mapping=None):
+        self.potcar_dir = Path(potcar_dir)
+        self.cache_dir = Path(cache_dir)
+        self.mapping = dict(mapping or {})
+        self._assembled = {}
+        self._lock = threading.Lock()
+
+    def _assemble(self, species):
+        with self._lock:
+            path = self._assembled.get(species)
+            if path is not None:
+                return path
+            parts = []
+            for el in species:
+                src = self.potcar_dir / self.mapping.get(el, el) / "POTCAR"
+                if not src.exists():
+                    raise FileNotFoundError(f"找不到 {el} 的赝势：{src}")
+                parts.append(src.read_bytes())
+            data = b"".join(parts)
+            digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+            labels = "_".join(self.mapping.get(el, el) for el in species)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self.cache_dir / f"POTCAR_{labels}_{digest}"
+            if not (path.exists() and path.read_bytes() == data):
+                tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            self._assembled[species] = path
+            return path
+
+    def install(self, workdir, species):
+        """在 workdir 放置与 species（POSCAR 物种顺序）对应的 POTCAR，返回 (是否成功, 说明)。"""
+        try:
+            src = self._assemble(tuple(species))
+        except OSError as e:
+            return False, str(e)
+        dest = Path(workdir) / "POTCAR"
+        dest.unlink(missing_ok=True)
+        try:
+            os.link(src, dest)
+            how = "硬链接"
+        except OSError:
+            shutil.copyfile(src, dest)
+            how = "复制"
+        labels = " ".join(self.mapping.get(el, el) for el in species)
+        return True, f"{how}自缓存（{labels}）"
+
+
+# ── 导出流水线 ──────────────────────────────────────────────────────────────
+#
+# 每个候选依次经过：准备（微扰 + 写 POSCAR + 复制输入文件）→ POTCAR → 提交。
+# 各候选在线程池中并行推进（这些步骤都是文件 I/O 或等待子进程，线程即可），
+# vaspkit 与提交命令分别用信号量限制同时运行的个数，避免压垮登录节点和调度器。
+# 单个候选的失败记录在它的报告里，不影响其它候选，最后统一汇总。
+
+def group_by_species(atoms, species_order):
+    """按 species_order 中的物种顺序稳定排序原子（同种原子保持原有相对顺序）。"""
+    rank = {el: k for k, el in enumerate(species_order)}
+    order = np.argsort([rank[s] for s in atoms.get_chemical_symbols()], kind="stable")
+    return atoms[order]
+
+
+def _prepare_candidate(cand, dirname, cfg, species_order):
+    """
+    写出 POSCAR（按 species_order 分组）并复制输入文件，
+    返回 (步骤记录, 警告列表, POSCAR 物种顺序)。
+    """
+    steps, problems = [], []
+    dirname.mkdir(parents=True, exist_ok=True)
 
-def write_structures(unique, nvac, element, outdir, sub_element=None, cfg=None):
-    """写出结构，并根据 cfg 复制输入文件、生成 POTCAR、提交任务。"""
-    outdir = Path(outdir)
-    outdir.mkdir(parents=True, exist_ok=True)
+    # ── 微扰 ──
+    final_atoms = cand["atoms_final"]
+    if cfg and cfg.get("perturb") and cand.get("defect_frac"):
+        final_atoms, n_perturbed = apply_perturbation(
+            final_atoms,
+            cand["defect_frac"],
+            amplitude=cfg["perturb_amplitude"],
+            radius=cfg["perturb_radius"],
+            seed=cfg.get("perturb_seed"),
+        )
+        steps.append(f"微扰 {n_perturbed} 个原子")
+
+    # ── 写 POSCAR：在微扰之后分组，微扰的随机数分配与原子顺序无关 ──
+    final_atoms = group_by_species(final_atoms, species_order)
+    sc = symbol_count(final_atoms.get_chemical_symbols())
+    write_poscar(dirname / "POSCAR", final_atoms, sc=sc)
+    steps.append("POSCAR")
+
+    # ── 复制输入文件 ──
+    if cfg and cfg.get("copy_inputs"):
+        for key, fname in [("incar", "INCAR"), ("kpoints", "KPOINTS")]:
+            src = cfg.get(key, "")
+            if src and Path(src).exists():
+                shutil.copy(src, dirname / fname)
+                steps.append(fname)
+            elif src:
+                problems.append(f"找不到 {src}，跳过复制 {fname}")
+
+        rs = cfg.get("runscript", "")
+        if rs and Path(rs).exists():
+            shutil.copy(rs, dirname / Path(rs).name)
+            steps.append(Path(rs).name)
+        elif rs:
+            problems.append(f"找不到运行脚本 {rs}")
+    return steps, problems, [el for el, _ in sc]
+
+
+def _submit_candidate(dirname, cfg):
+    """提交任务，返回 (是否成功, 说明)。"""
+    script = cfg.get("submit_script", "run.sh")
+    script_path = dirname / Path(script).name
+    if not script_path.exists():
+        return False, f"提交脚本不存在：{script_path}，跳过提交"
+    cmd = [cfg.get("submit_cmd", "sbatch"), str(script_path.name)]
+    try:
+        result = subprocess.run(
+            cmd, cwd=str(dirname),
+            capture_output=True, text=True, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        return False, f"提交失败：{e.stderr.strip()}"
+    except FileNotFoundError:
+        return False, f"找不到提交命令 {cmd[0]}"
+    return True, result.stdout.strip()
 
-    defect_tag = f"{element}sub{sub_element}{nvac}" if sub_element else f"{element}vac{nvac}"
 
-    for i, cand in enumerate(unique):
-        wyk_str = "-".join(cand["wyckoffs"])
-        dirname = outdir / f"{defect_tag}_{i+1:03d}_{wyk_str}"
-        dirname.mkdir(parents=True, exist_ok=True)
-
-        # ── 微扰 ──
-        final_atoms = cand["atoms_final"]
-        if cfg and cfg.get("perturb") and cand.get("defect_frac"):
-            final_atoms, n_perturbed = apply_perturbation(
-                final_atoms,
-                cand["defect_frac"],
-                amplitude=cfg["perturb_amplitude"],
-                radius=cfg["perturb_radius"],
-                seed=cfg.get("perturb_seed"),
-            )
-            print(f"  [微扰] {dirname.name}: 影响 {n_perturbed} 个原子")
-
-        # ── 写 POSCAR ──
-        poscar_out = dirname / "POSCAR"
-        write(str(poscar_out), final_atoms, format="vasp", direct=True)
-        print(f"  [写出] {i+1:>3}  {cand['label']:<42} → {dirname.name}/POSCAR")
-
-        # ── 复制输入文件 ──
-        if cfg and cfg.get("copy_inputs"):
-            for key, fname in [("incar", "INCAR"), ("kpoints", "KPOINTS")]:
-                src = cfg.get(key, "")
-                if src and Path(src).exists():
-                    shutil.copy(src, dirname / fname)
-                    print(f"         复制 {fname} → {dirname.name}/")
-                elif src:
-                    print(f"  [警告] 找不到 {src}，跳过复制 {fname}")
-
-            rs = cfg.get("runscript", "")
-            if rs and Path(rs).exists():
-                dst_name = Path(rs).name
-                shutil.copy(rs, dirname / dst_name)
-                print(f"         复制 {dst_name} → {dirname.name}/")
-            elif rs:
-                print(f"  [警告] 找不到运行脚本 {rs}")
-
-        # ── 生成 POTCAR（在 POSCAR 写出后、在该目录内运行 vaspkit）──
+def _export_candidate(i, cand, dirname, cfg, species_order, vaspkit_slots, submit_slots,
+                      potcars=None):
+    """单个候选的完整导出流程，返回报告 dict；异常不会外抛。"""
+    report = {"index": i + 1, "label": cand["label"], "dir": dirname.name,
+              "steps": [], "errors": []}
+    try:
+        steps, problems, species = _prepare_candidate(cand, dirname, cfg, species_order)
+        report["steps"] += steps
+        report["errors"] += problems
+
+        # ── 生成 POTCAR：有库目录时从拼接缓存放置，否则在该目录内运行 vaspkit ──
         if cfg and cfg.get("gen_potcar"):
-            generate_potcar(dirname)
+            if potcars is not None:
+                ok, msg = potcars.install(dirname, species)
+            else:
+                with vaspkit_slots:
+                    ok, msg = generate_potcar(dirname)
+            (report["steps"] if ok else report["errors"]).append(f"POTCAR: {msg}")
+            if not ok and cfg.get("submit"):
+                report["errors"].append("缺少 POTCAR，跳过提交")
+                return report
 
         # ── 提交任务 ──
         if cfg and cfg.get("submit"):
-            script = cfg.get("submit_script", "run.sh")
-            script_path = dirname / Path(script).name
-            if script_path.exists():
-                cmd = [cfg.get("submit_cmd", "sbatch"), str(script_path.name)]
-                try:
-                    result = subprocess.run(
-                        cmd, cwd=str(dirname),
-                        capture_output=True, text=True, check=True
-                    )
-                    print(f"  [提交] {dirname.name}: {result.stdout.strip()}")
-                except subprocess.CalledProcessError as e:
-                    print(f"  [错误] 提交失败 {dirname.name}: {e.stderr.strip()}")
-            else:
-                print(f"  [警告] 提交脚本不存在：{script_path}，跳过提交")
+            with submit_slots:
+                ok, msg = _submit_candidate(dirname, cfg)
+            (report["steps"] if ok else report["errors"]).append(f"提交: {msg}")
+    except Exception as e:          # 单个候选失败不影响其它候选
+        report["errors"].append(f"{type(e).__name__}: {e}")
+    return report
+
+
+def print_export_report(reports, outdir):
+    """汇总导出结果，失败项逐条列出，并写出 export_report.json。"""
+    failed = [r for r in reports if r["errors"]]
+    print(f"\n  导出完成：{len(reports) - len(failed)} 成功，{len(failed)} 有问题")
+    for r in failed:
+        print(f"  [问题] {r['index']:>3}  {r['dir']}")
+        for err in r["errors"]:
+            print(f"         - {err}")
+    report_path = Path(outdir) / "export_report.json"
+    report_path.write_text(json.dumps(reports, indent=2, ensure_ascii=False))
+    print(f"  详细报告：{report_path}")
+
+
+def write_structures(unique, nvac, element, outdir, sub_element=None, cfg=None,
+                     jobs=8, max_vaspkit=4, max_submit=1):
+    """
+    写出结构，并根据 cfg 复制输入文件、生成 POTCAR、提交任务。
+    jobs 个线程并行处理各候选；vaspkit 与提交命令最多分别同时运行
+    max_vaspkit / max_submit 个。返回每个候选的报告列表（顺序与 unique 相同）。
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    defect_tag = f"{element}sub{sub_element}{nvac}" if sub_element else f"{element}vac{nvac}"
+    vaspkit_slots = threading.Semaphore(max(1, max_vaspkit))
+    submit_slots = threading.Semaphore(max(1, max_submit))
+    # 所有子结构共用的物种顺序（按首次出现），使同一母结构的子结构 POSCAR 物种顺序一致
+    species_order = list(dict.fromkeys(
+        el for cand in unique for el, _ in symbol_count(cand["atoms_final"].get_chemical_symbols())))
+    potcars = None
+    if cfg and cfg.get("gen_potcar") and cfg.get("potcar_dir"):
+        potcars = PotcarLibrary(cfg["potcar_dir"], outdir / ".potcar_cache",
+                                cfg.get("potcar_map"))
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = []
+        for i, cand in enumerate(unique):
+            wyk_str = "-".join(cand["wyckoffs"])
+            dirname = outdir / f"{defect_tag}_{i+1:03d}_{wyk_str}"
+            futures.append(pool.submit(_export_candidate, i, cand, dirname, cfg, species_order,
+                                       vaspkit_slots, submit_slots, potcars))
+        reports = []
+        for fut in futures:         # 按候选顺序输出进度
+            r = fut.result()
+            mark = "写出" if not r["errors"] else "问题"
+            print(f"  [{mark}] {r['index']:>3}  {r['label']:<42} → {r['dir']}/  "
+                  f"({', '.join(r['steps'])})")
+            reports.append(r)
+
+    print_export_report(reports, outdir)
+    return reports
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -463,6 +773,19 @@ def main():
         help="微扰幅度 Å（默认：0.05）")
     parser.add_argument("--radius", type=float, default=3.0,
         help="微扰半径 Å（默认：3.0）")
+    # 导出流水线并发
+    parser.add_argument("--jobs", "-j", type=int, default=8,
+        help="导出时并行处理的候选数（线程，默认：8）")
+    parser.add_argument("--max-vaspkit", type=int, default=4,
+        help="同时运行的 vaspkit 个数上限（默认：4）")
+    parser.add_argument("--max-submit", type=int, default=1,
+        help="同时运行的提交命令个数上限（默认：1）")
+    # POTCAR 库（替代 vaspkit）
+    parser.add_argument("--potcar-dir", default=None,
+        help="POTCAR 库目录（<目录>/<赝势名>/POTCAR）；给出时 --export 直接拼接 POTCAR，"
+             "不再运行 vaspkit（默认：$VASP_PP_PATH/potpaw_PBE，仅交互式时作为默认值）")
+    parser.add_argument("--potcar-map", nargs="+", default=None, metavar="EL=LABEL",
+        help="元素到赝势目录名的映射，如 Sr=Sr_sv Ti=Ti_sv（默认同元素名）")
     args = parser.parse_args()
 
     sub_element = args.sub
@@ -490,10 +813,19 @@ def main():
         sys.exit(1)
     print_single_summary(atoms, sites, ds, args.element)
 
+    try:
+        potcar_map = parse_potcar_map(args.potcar_map)
+    except ValueError as e:
+        print(f"[错误] {e}", file=sys.stderr)
+        sys.exit(1)
+    potcar_default = args.potcar_dir
+    if potcar_default is None and os.environ.get("VASP_PP_PATH"):
+        potcar_default = str(Path(os.environ["VASP_PP_PATH"]) / "potpaw_PBE")
+
     # ── 交互式配置 ──
     cfg = None
     if args.interactive and args.export:
-        cfg = interactive_setup()
+        cfg = interactive_setup(potcar_default)
     elif args.perturb:
         # 非交互式微扰
         cfg = {
@@ -502,6 +834,10 @@ def main():
             "perturb_radius"   : args.radius,
             "perturb_seed"     : 42,
         }
+    if args.potcar_dir and args.export and not args.interactive:
+        cfg = dict(cfg or {}, gen_potcar=True, potcar_dir=args.potcar_dir)
+    if cfg is not None:
+        cfg["potcar_map"] = potcar_map
 
     # ── 单缺陷快速路径 ──
     if args.nvac == 1:
@@ -519,7 +855,8 @@ def main():
             })
         if args.export:
             print(f"正在生成单缺陷结构 → {outdir}/\n")
-            write_structures(unique, 1, args.element, outdir, sub_element, cfg)
+            write_structures(unique, 1, args.element, outdir, sub_element, cfg,
+                             args.jobs, args.max_vaspkit, args.max_submit)
             print(f"\n完成！共生成 {len(unique)} 个结构。\n")
         else:
             print(f"  共 {len(unique)} 个不等价位点（使用 --export 写出结构）\n")
@@ -532,20 +869,26 @@ def main():
               file=sys.stderr)
         sys.exit(1)
 
-    print(f"枚举 {args.nvac} 缺陷组合（递归对称分析）...")
+    print(f"枚举 {args.nvac} 缺陷组合（母结构对称群轨道枚举）...")
+    try:
+        group = defect_site_group(atoms, args.element, args.symprec)
+    except RuntimeError as e:
+        print(f"[错误] {e}", file=sys.stderr)
+        sys.exit(1)
     candidates = enumerate_multi_defect(
-        atoms, args.element, args.symprec, args.nvac, sub_element
+        atoms, args.element, args.symprec, args.nvac, sub_element, group=group
     )
     print(f"  枚举完毕，原始候选数：{len(candidates)}")
 
-    unique = deduplicate(candidates, args.symprec)
+    unique = deduplicate(candidates, group)
     print(f"  去重后唯一结构数：{len(unique)}\n")
 
     print_multi_summary(unique, args.nvac, args.element, args.symprec, sub_element)
 
     if args.export:
         print(f"正在写出结构 → {outdir}/\n")
-        write_structures(unique, args.nvac, args.element, outdir, sub_element, cfg)
+        write_structures(unique, args.nvac, args.element, outdir, sub_element, cfg,
+                         args.jobs, args.max_vaspkit, args.max_submit)
         print(f"\n完成！共生成 {len(unique)} 个不等价缺陷结构。\n")
     else:
         print("  使用 --export 写出结构文件。\n")
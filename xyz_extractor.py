@@ -26,6 +26,9 @@ Examples:
 
   # Dry-run: show what would be extracted without writing
   xyz_extractor.py -i traj.xyz -r 50 --start 1000 --dry-run
+
+If a valid binary cache <input>.cache/ exists (bond_length_traj.py --cache),
+its frame index is reused and the text scan is skipped (--no-cache to disable).
 """
 
 import argparse
@@ -43,6 +46,8 @@ def build_frame_index(path: Path) -> tuple[list[int], int]:
     Scan the file once and return:
       offsets  — byte offset of the first line of each frame
       num_atoms — number of atoms (assumed constant across all frames)
+    Trailing blank lines are ignored.  Raises ValueError on a malformed
+    header, an inconsistent atom count or a truncated frame.
     """
     offsets: list[int] = []
     num_atoms: int = -1
@@ -53,21 +58,23 @@ def build_frame_index(path: Path) -> tuple[list[int], int]:
             header = fh.readline()
             if not header:
                 break  # EOF
+            if not header.strip() and not fh.read().strip():
+                break  # only blank lines left
 
             try:
                 n = int(header.strip())
             except ValueError:
-                sys.exit(
-                    f"Error: expected atom-count line, got: {header.decode().rstrip()!r}\n"
+                raise ValueError(
+                    f"expected atom-count line, got: {header.decode().rstrip()!r} "
                     f"(near byte offset {offset})"
-                )
+                ) from None
 
             if num_atoms == -1:
                 num_atoms = n
             elif n != num_atoms:
-                sys.exit(
-                    f"Error: inconsistent atom count at frame {len(offsets)} "
-                    f"(expected {num_atoms}, got {n})."
+                raise ValueError(
+                    f"inconsistent atom count at frame {len(offsets)} "
+                    f"(expected {num_atoms}, got {n})"
                 )
 
             offsets.append(offset)
@@ -75,11 +82,32 @@ def build_frame_index(path: Path) -> tuple[list[int], int]:
             # Skip comment line + N atom lines
             for _ in range(n + 1):
                 if not fh.readline():
-                    sys.exit(f"Error: file truncated inside frame {len(offsets) - 1}.")
+                    raise ValueError(f"file truncated inside frame {len(offsets) - 1}")
 
     return offsets, num_atoms
 
 
+def load_frame_index(path: Path, use_cache: bool = True) -> tuple[list[int], int, bool]:
+    """
+    Like build_frame_index, but reuse the frame offsets stored in a valid
+    binary trajectory cache (<input>.cache/, written by bond_length_traj.py --cache
+    via traj_cache.py) instead of scanning the text file.
+    Returns (offsets, num_atoms, from_cache).
+    """
+    if use_cache and path.with_name(path.name + ".cache").is_dir():
+        try:
+            from traj_cache import cached_frame_index
+        except ImportError:  # numpy not available
+            cached = None
+        else:
+            cached = cached_frame_index(path)
+        if cached is not None:
+            offsets, num_atoms = cached
+            return offsets, num_atoms, True
+    offsets, num_atoms = build_frame_index(path)
+    return offsets, num_atoms, False
+
+
 # ---------------------------------------------------------------------------
 # Frame writer
 # ---------------------------------------------------------------------------
@@ -233,6 +261,8 @@ def build_parser() -> argparse.ArgumentParser:
                    help="Random seed for reproducibility (only used with -r).")
     p.add_argument("--dry-run", action="store_true",
                    help="Print what would be extracted without writing any file.")
+    p.add_argument("--no-cache", action="store_true",
+                   help="Always scan the text file, ignoring any <input>.cache/ frame index.")
     p.add_argument("-v", "--verbose", action="store_true",
                    help="Print extra information.")
 
@@ -252,9 +282,13 @@ def main() -> None:
 
     # ---- Index the trajectory ----
     print(f"Indexing {src} …", end=" ", flush=True)
-    offsets, num_atoms = build_frame_index(src)
+    try:
+        offsets, num_atoms, from_cache = load_frame_index(src, use_cache=not args.no_cache)
+    except ValueError as e:
+        sys.exit(f"Error: {e}.")
     total = len(offsets)
-    print(f"{total} frames found, {num_atoms} atoms each.")
+    print(f"{total} frames found, {num_atoms} atoms each."
+          + ("  (index from cache)" if from_cache else ""))
 
     # ---- Resolve frame selection ----
     if args.frame is not None: